@@ -1,3 +1,12 @@
+import http.server
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+
+import pytest
+
 from ugt_fwtools import utils
 
 
@@ -5,3 +14,219 @@ def test_build_t():
     assert utils.build_t("42") == "0042"
     assert utils.build_t("1234") == "1234"
     assert utils.build_t("0x1234") == "1234"
+
+
+def test_remove_file(tmp_path):
+    filename = tmp_path / "sample.txt"
+    filename.write_text("sample")
+    utils.remove_file(str(filename))
+    assert not filename.exists()
+    utils.remove_file(str(filename))  # ignores missing files
+
+
+def test_wait_for_file(tmp_path):
+    filename = tmp_path / "running.lock"
+    with pytest.raises(RuntimeError):
+        utils.wait_for_file(str(filename), timeout=0.2)
+    timer = threading.Timer(0.1, filename.touch)
+    timer.start()
+    utils.wait_for_file(str(filename), timeout=5.0)
+    timer.join()
+    assert filename.exists()
+
+
+def test_count_modules(tmp_path):
+    assert utils.count_modules(str(tmp_path)) == 0
+    for name in ["module_0", "module_1", "other"]:
+        (tmp_path / "vhdl" / name).mkdir(parents=True)
+    assert utils.count_modules(str(tmp_path)) == 2
+
+
+def test_read_file_cached(tmp_path):
+    filename = tmp_path / "sample.txt"
+    filename.write_text("spam")
+    assert utils.read_file_cached(str(filename)) == "spam"
+    filename.write_text("eggs and spam")
+    assert utils.read_file_cached(str(filename)) == "eggs and spam"
+
+
+def test_replace_all():
+    replace_map = {"{{foo}}": "spam", "{{foobar}}": "eggs", "{{bar}}": "{{foo}}"}
+    assert utils.replace_all("{{foo}} {{foobar}} {{bar}}", replace_map) == "spam eggs {{foo}}"
+    assert utils.replace_all("{{foo}}", {"{{foo}}": "spam"}) == "spam"
+    assert utils.replace_all("{{foo}}", {}) == "{{foo}}"
+
+
+def test_template_replace(tmp_path):
+    template = tmp_path / "sample_tpl.vhd"
+    result = tmp_path / "sample.vhd"
+    template.write_text("-- {{name}}\nconstant {{name}} : integer := {{value}};\n  -- {{value}}\nx <= {{value}}; -- {{name}}\n")
+    utils.template_replace(str(template), {"{{name}}": "FOO", "{{value}}": "42"}, str(result))
+    assert result.read_text() == "-- {{name}}\nconstant FOO : integer := 42;\n  -- {{value}}\nx <= 42; -- FOO\n"
+
+
+@pytest.mark.skipif(shutil.which("tclsh") is None, reason="requires tclsh")
+def test_vivado_session(tmp_path):
+    dirname = tmp_path / "path {with} $pecial [chars]"
+    with utils.VivadoSession(["tclsh"]) as vivado:
+        vivado.run(f"file mkdir {utils.tcl_quote(str(dirname))}")
+        with pytest.raises(RuntimeError, match="incomplete script"):
+            vivado.run("puts {unbalanced")
+        with pytest.raises(RuntimeError, match="failed: spam"):
+            vivado.run("error spam")
+        vivado.run("set x 42")
+    assert dirname.is_dir()
+    with utils.VivadoSession(["tclsh"]) as vivado:
+        with pytest.raises(RuntimeError, match="timed out"):
+            vivado.run("after 5000", timeout=0.2)
+    with utils.VivadoSession(["tclsh"]) as vivado:
+        with pytest.raises(RuntimeError, match="terminated"):
+            vivado.run("exit 1")
+
+
+class ETagHandler(http.server.BaseHTTPRequestHandler):
+    content = {"/sample.vhd": b"spam"}
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        body = self.content[self.path]
+        etag = f'"{len(body)}-{hash(body)}"'
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def http_url(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    ETagHandler.requests = []
+    server = http.server.HTTPServer(("127.0.0.1", 0), ETagHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.skipif(utils.requests is None, reason="requires requests")
+def test_download_cache(tmp_path, http_url, monkeypatch):
+    filename = tmp_path / "sample.vhd"
+    url = f"{http_url}/sample.vhd"
+    utils.download_file_from_url(url, str(filename))  # 200, cached
+    utils.download_file_from_url(url, str(filename))  # 304, from cache
+    assert filename.read_bytes() == b"spam"
+    assert [etag is None for _, etag in ETagHandler.requests] == [True, False]
+    monkeypatch.setitem(ETagHandler.content, "/sample.vhd", b"eggs")
+    utils.download_file_from_url(url, str(filename))  # 200, modified
+    assert filename.read_bytes() == b"eggs"
+    utils.download_file_from_url(url, str(filename))  # 304, updated cache entry
+    assert filename.read_bytes() == b"eggs"
+    assert ETagHandler.requests[-1][1] is not None
+    assert not list((tmp_path / "cache" / "ugt_fwtools" / "downloads").glob(".tmp-*"))
+
+
+@pytest.mark.skipif(utils.requests is None, reason="requires requests")
+def test_download_cache_limits(tmp_path, http_url, monkeypatch):
+    filename = tmp_path / "sample.vhd"
+    url = f"{http_url}/sample.vhd"
+    monkeypatch.setenv("UGT_DOWNLOAD_CACHE", "0")
+    utils.download_file_from_url(url, str(filename))
+    utils.download_file_from_url(url, str(filename))
+    monkeypatch.delenv("UGT_DOWNLOAD_CACHE")
+    monkeypatch.setattr(utils, "DOWNLOAD_CACHE_MAX_FILE_SIZE", 2)
+    utils.download_file_from_url(url, str(filename))
+    utils.download_file_from_url(url, str(filename))
+    assert [etag for _, etag in ETagHandler.requests] == [None] * 4
+    # Least recently used entries are removed
+    monkeypatch.setattr(utils, "DOWNLOAD_CACHE_MAX_FILE_SIZE", 1024)
+    monkeypatch.setattr(utils, "DOWNLOAD_CACHE_MAX_SIZE", 6)
+    monkeypatch.setitem(ETagHandler.content, "/other.vhd", b"eggs")
+    utils.download_file_from_url(url, str(filename))
+    cache_path = tmp_path / "cache" / "ugt_fwtools" / "downloads"
+    for path in cache_path.iterdir():
+        os.utime(str(path), (0, 0))
+    utils.download_file_from_url(f"{http_url}/other.vhd", str(filename))
+    cached = list(cache_path.iterdir())
+    assert sorted(path.suffix for path in cached) == ["", ".json"]
+    assert filename.read_bytes() == b"eggs"
+
+
+@pytest.mark.skipif(utils.requests is None, reason="requires requests")
+def test_download_cache_unusable(tmp_path, http_url, monkeypatch):
+    filename = tmp_path / "sample.vhd"
+    url = f"{http_url}/sample.vhd"
+    not_a_dir = tmp_path / "not_a_dir"
+    not_a_dir.write_text("")
+    monkeypatch.setenv("XDG_CACHE_HOME", str(not_a_dir))
+    utils.download_file_from_url(url, str(filename))
+    monkeypatch.setenv("UGT_DOWNLOAD_CACHE", "0")
+    utils.download_file_from_url(url, str(filename))
+    assert [etag for _, etag in ETagHandler.requests] == [None] * 2
+    assert filename.read_bytes() == ETagHandler.content["/sample.vhd"]
+
+
+def test_split_gitlab_raw_uri():
+    assert utils.split_gitlab_raw_uri("https://gitlab.cern.ch/foo/menu/-/raw/v1.0/2024/L1Menu_X/xml/L1Menu_X.xml?inline=false") == (
+        "https://gitlab.cern.ch/foo/menu", "v1.0", "2024/L1Menu_X/xml/L1Menu_X.xml"
+    )
+    assert utils.split_gitlab_raw_uri("https://gitlab.cern.ch/foo/menu/-/raw/feature%2Fx/xml/menu.xml") == (
+        "https://gitlab.cern.ch/foo/menu", "feature/x", "xml/menu.xml"
+    )
+    assert utils.split_gitlab_raw_uri("https://raw.githubusercontent.com/foo/menu/master/xml/menu.xml") is None
+    assert utils.split_gitlab_raw_uri("file:///foo/menu/-/raw/master/xml/menu.xml") is None
+    assert utils.gitlab_archive_uri("https://gitlab.cern.ch/foo/menu", "feature/x", "2024/L1Menu_X/vhdl") == (
+        "https://gitlab.cern.ch/foo/menu/-/archive/feature/x/menu-feature-x.tar.gz?path=2024%2FL1Menu_X%2Fvhdl"
+    )
+
+
+def test_extract_archive_files(tmp_path):
+    src_dir = tmp_path / "menu-master-1234" / "L1Menu_X" / "vhdl" / "module_0" / "src"
+    src_dir.mkdir(parents=True)
+    (src_dir / "algo_index.vhd").write_text("spam")
+    archive = tmp_path / "archive.tar.gz"
+    with tarfile.open(str(archive), "w:gz") as tar:
+        tar.add(str(tmp_path / "menu-master-1234"), arcname="menu-master-1234")
+    filename = tmp_path / "algo_index.vhd"
+    files = [("module_0/src/algo_index.vhd", str(filename))]
+    assert utils.extract_archive_files(archive.as_uri(), "L1Menu_X/vhdl", files)
+    assert filename.read_text() == "spam"
+    missing = [("module_1/src/algo_index.vhd", str(tmp_path / "missing.vhd"))]
+    assert not utils.extract_archive_files(archive.as_uri(), "L1Menu_X/vhdl", files + missing)
+    assert not (tmp_path / "missing.vhd").exists()
+    archive.write_bytes(archive.read_bytes()[:32])  # truncated
+    assert not utils.extract_archive_files(archive.as_uri(), "L1Menu_X/vhdl", files)
+    assert not utils.extract_archive_files((tmp_path / "none.tar.gz").as_uri(), "L1Menu_X/vhdl", files)
+
+
+def git(*args, cwd):
+    subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args], cwd=str(cwd), check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="requires git")
+def test_ensure_git_mirror(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+    repo = tmp_path / "sample.git"
+    repo.mkdir()
+    git("init", cwd=repo)
+    git("commit", "--allow-empty", "-m", "first", cwd=repo)
+    git("tag", "v1", cwd=repo)
+    url = repo.as_uri()
+    mirror = utils.ensure_git_mirror(url)
+    assert os.path.basename(mirror) == "sample.git"
+    git("commit", "--allow-empty", "-m", "second", cwd=repo)
+    git("tag", "v2", cwd=repo)
+    assert utils.ensure_git_mirror(url) == mirror  # updated
+    git("clone", "--depth", "1", "-b", "v2", f"file://{mirror}", cwd=tmp_path)
+    assert (tmp_path / "sample" / ".git").is_dir()
+    with pytest.raises(subprocess.CalledProcessError):
+        utils.ensure_git_mirror((tmp_path / "missing.git").as_uri())
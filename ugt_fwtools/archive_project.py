@@ -1,7 +1,11 @@
 import argparse
 import configparser
+import functools
+import logging
 import os
-import tempfile
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple
 
 from . import utils
 
@@ -10,31 +14,68 @@ def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser()
     parser.add_argument("filename", help="build config file (*.cfg)")
     parser.add_argument("-m", type=int)
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of concurrent Vivado processes (default is 1)")
     return parser.parse_args()
 
 
+@functools.lru_cache(maxsize=32)
+def load_build_config(filename: str) -> Tuple[str, int]:
+    """Returns menu build and number of modules from build config file."""
+    config = configparser.ConfigParser()
+    config.read(filename)
+    return config.get("menu", "build"), int(config.get("menu", "modules"))
+
+
+def project_filename(buildarea: str, module_id: str) -> str:
+    """Returns path of the Vivado project file of a module."""
+    return f"{buildarea}/proj/{module_id}/{module_id}/{module_id}.xpr"
+
+
+def archive_modules(buildarea: str, outdir: str, menu_build: str, module_ids: List[str]) -> None:
+    """Archive Vivado projects of modules within a single Vivado session.
+    *buildarea* and *outdir* are expected to be absolute paths.
+    """
+    zip_prefix = f"{outdir}/0x{menu_build}_"
+    with utils.VivadoSession() as vivado:
+        for module_id in module_ids:
+            project_file = project_filename(buildarea, module_id)
+            archive_file = f"{zip_prefix}{module_id}.zip"
+            logging.info("archiving %s to %r ...", module_id, archive_file)
+            vivado.run(f"open_project {utils.tcl_quote(project_file)}\narchive_project {utils.tcl_quote(archive_file)}\nclose_project")
+
+
 def main():
     args = parse_args()
 
-    config = configparser.ConfigParser()
-    config.read(args.filename)
-    menu_build = config.get("menu", "build")
-    menu_modules = int(config.get("menu", "modules"))
-    buildarea = os.path.dirname(args.filename)  # relative to build config
+    # Setup console logging
+    logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.INFO)
+
+    menu_build, menu_modules = load_build_config(args.filename)
+    buildarea = os.path.abspath(os.path.dirname(args.filename))  # relative to build config
+    outdir = os.getcwd()
 
     if args.m is not None:
         module_ids = [f"module_{args.m}"]
     else:
         module_ids = [f"module_{m}" for m in range(menu_modules)]
 
-    for module_id in module_ids:
-        project_file = os.path.realpath(os.path.join(buildarea, "proj", module_id, module_id, f"{module_id}.xpr"))
-        archive_file = os.path.realpath(os.path.join(os.getcwd(), f"0x{menu_build}_{module_id}.zip"))
-        with tempfile.NamedTemporaryFile(delete=True) as source:
-            source.write(f"open_project {project_file}\n".encode())
-            source.write(f"archive_project {archive_file}\n".encode())
-            source.flush()
-            utils.vivado_batch(source.name)
+    # Skip missing projects before paying for a Vivado startup
+    for module_id in module_ids[:]:
+        project_file = project_filename(buildarea, module_id)
+        if not os.path.isfile(project_file):
+            logging.warning("no such project file: %r, skipping %s", project_file, module_id)
+            module_ids.remove(module_id)
+    if not module_ids:
+        raise RuntimeError("no Vivado projects found to archive")
+
+    # Distribute modules over concurrent Vivado sessions (each instance
+    # can use several GB of memory, so this defaults to a single one).
+    jobs = max(1, min(args.jobs, len(module_ids)))
+    groups = [module_ids[i::jobs] for i in range(jobs)]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [executor.submit(archive_modules, buildarea, outdir, menu_build, group) for group in groups]
+        for future in futures:
+            future.result()
 
 
 if __name__ == "__main__":
@@ -1,7 +1,11 @@
 import argparse
+import hashlib
+import json
 import logging
 import os
+import shlex
 import shutil
+import subprocess
 import tempfile
 
 from . import utils
@@ -9,14 +13,65 @@ from . import utils
 DefaultQuestaSimPath = "/opt/mentor/questasim"
 DefaultQuestaSimLibsPath = "questasimlibs"
 
-pwd_script = os.path.dirname(__file__)
-pwd = os.getcwd()
-
 
 def run_command(*args):
-    command = " ".join(args)
-    logging.info(">$ %s", command)
-    os.system(command)
+    logging.info(">$ %s", " ".join(shlex.quote(arg) for arg in args))
+    subprocess.run(list(args), check=True)
+
+
+def simlib_cache_path(vivado, questasim):
+    """Returns cache location of Questa sim libs for Vivado and Questasim version."""
+    cache_key = hashlib.sha1(f"{vivado}|{questasim}".encode()).hexdigest()[:12]
+    return utils.cache_dir(f"qlibs_{cache_key}")
+
+
+def restore_simlib_cache(cache_path, settings64, questasimlib_path):
+    """Copy cached Questa sim libs to *questasimlib_path*, returns False if
+    there is no valid cache entry.
+    """
+    try:
+        with open(f"{cache_path}.json", "rt") as fp:
+            stamp = json.load(fp)
+        if stamp.get("settings64_mtime") != os.path.getmtime(settings64):
+            return False
+    except (OSError, ValueError):
+        return False
+    if not os.path.isfile(os.path.join(cache_path, "modelsim.ini")) or os.path.exists(questasimlib_path):
+        return False
+    try:
+        shutil.copytree(cache_path, questasimlib_path, symlinks=True)
+        # Library mappings in modelsim.ini are absolute paths
+        ini_file = os.path.join(questasimlib_path, "modelsim.ini")
+        content = utils.read_file(ini_file)
+        with open(ini_file, "wt") as fp:
+            fp.write(content.replace(stamp["path"], os.path.abspath(questasimlib_path)))
+    except OSError as exc:
+        logging.warning("Unable to restore Questa sim libs from cache %s: %s", cache_path, exc)
+        utils.remove(questasimlib_path)  # compile from scratch instead
+        return False
+    return True
+
+
+def update_simlib_cache(cache_path, settings64, questasimlib_path):
+    """Store compiled Questa sim libs from *questasimlib_path* in cache. The
+    stamp file is written last, an interrupted update leaves no valid entry.
+    """
+    stamp_file = f"{cache_path}.json"
+    tmp_path = f"{cache_path}.tmp"
+    utils.remove_file(stamp_file)
+    utils.remove(tmp_path)
+    try:
+        shutil.copytree(questasimlib_path, tmp_path, symlinks=True)
+        utils.remove(cache_path)
+        os.replace(tmp_path, cache_path)
+    finally:
+        utils.remove(tmp_path)
+    with open(f"{stamp_file}.tmp", "wt") as fp:
+        json.dump({
+            "settings64_mtime": os.path.getmtime(settings64),
+            "path": os.path.abspath(questasimlib_path),
+        }, fp)
+    os.replace(f"{stamp_file}.tmp", stamp_file)
 
 
 def run_compile_simlib(vivado, questasim, questasimlib_path):
@@ -27,6 +82,7 @@ def run_compile_simlib(vivado, questasim, questasimlib_path):
         raise RuntimeError("Environment variable 'UGT_VIVADO_BASE_DIR' not set. Set with: 'export UGT_VIVADO_BASE_DIR=... (e.g. export UGT_VIVADO_BASE_DIR=/opt/xilinx/Vivado'")
 
     settings64 = os.path.join(vivado_base_dir, vivado, "settings64.sh")
+    pwd = os.getcwd()
 
     # Simulation directory
     temp_dir = tempfile.mkdtemp()
@@ -40,22 +96,36 @@ def run_compile_simlib(vivado, questasim, questasimlib_path):
         tcl_file = os.path.join(temp_dir, "compile_simlib.tcl")
         tcl_compile_cmd = "compile_simlib -simulator questa -simulator_exec_path {questasim_path} -family virtex7 -language vhdl -library all -dir {questasimlib_path_tcl}".format(**locals())
 
-        # Writing commands to tcl file
-        with open(tcl_file, "wt") as fp:
-            fp.write("#!/usr/bin/tcls\n")
-            fp.write(f"{tcl_compile_cmd}\n")
-            fp.write("exit\n")
+        # Cache shares the opt-out of the download cache (UGT_DOWNLOAD_CACHE=0)
+        cache_path = None
+        if not os.path.isdir(questasimlib_path) and utils.cache_enabled("download"):
+            try:
+                cache_path = simlib_cache_path(vivado, questasim)
+            except OSError as exc:
+                logging.warning("Questa sim libs cache not available: %s", exc)
 
         # Checking if questasimlib_path exists
-        if not os.path.isdir(questasimlib_path):
+        if not os.path.isdir(questasimlib_path) and cache_path and restore_simlib_cache(cache_path, settings64, questasimlib_path):
+            logging.info("===========================================================================")
+            logging.info("Questa sim libs in %s restored from cache %s", questasimlib_path, cache_path)
+            logging.info("===========================================================================")
+        elif not os.path.isdir(questasimlib_path):
             logging.info("===========================================================================")
+            # Writing commands to tcl file (only required if libs are compiled)
+            with open(tcl_file, "wt") as fp:
+                fp.write(f"#!/usr/bin/tclsh\n{tcl_compile_cmd}\nexit\n")
             # Remove modelsim.ini before creating sim libs to get correct modelsim.ini in $HOME/questasimlibs_<version>
-            utils.remove(os.path.join(pwd, "modelsim.ini"))
-            source_tcl = os.path.join(pwd_script, "..", "firmware", "sim", "scripts", "compile_simlib.tcl")
-            command = f'bash -c "source {settings64}; vivado -mode batch -source {source_tcl}"'
-            logging.info("Creating Questa sim libs in %s (running %r)", questasimlib_path, source_tcl)
-            run_command(command)
-            utils.remove(os.path.join(pwd, "modelsim.ini"))
+            utils.remove_file(os.path.join(pwd, "modelsim.ini"))
+            command = f"source {shlex.quote(settings64)}; vivado -mode batch -source {shlex.quote(tcl_file)}"
+            logging.info("Creating Questa sim libs in %s (running %r)", questasimlib_path, tcl_file)
+            run_command("bash", "-c", command)
+            utils.remove_file(os.path.join(pwd, "modelsim.ini"))
+            if cache_path:
+                logging.info("Caching Questa sim libs in %s", cache_path)
+                try:
+                    update_simlib_cache(cache_path, settings64, questasimlib_path)
+                except OSError as exc:
+                    logging.warning("Unable to cache Questa sim libs in %s: %s", cache_path, exc)
             logging.info("Done!")
             logging.info("===========================================================================")
         else:
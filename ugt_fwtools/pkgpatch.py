@@ -86,23 +86,25 @@ def parse_args():
     return parser.parse_args(sys.argv[1:])
 
 
-def main():
-    args = parse_args()
-
-    if os.path.abspath(args.src) == os.path.abspath(args.dest):
-        print("for safety reasons it is not allowed to overwrite the source template.")
-        sys.exit(1)
-
+def patch(src, dest, build, timestamp=None, username=None, hostname=None):
+    """Patch VHDL package template *src* and write result to *dest*. *build*
+    is the menu build version (integer), *timestamp*, *username* and
+    *hostname* default to current time, user and machine.
+    """
+    if username is None:
+        username = getuser()
+    if hostname is None:
+        hostname = gethostname()
     replace_map = {
-        "{{IPBUS_TIMESTAMP}}": hex_timestamp(args.timestamp),
-        "{{IPBUS_USERNAME}}": hex_string(args.username),
-        "{{IPBUS_HOSTNAME}}": hex_string(args.hostname),
-        "{{IPBUS_BUILD_VERSION}}": hex_value(args.build),
+        "{{IPBUS_TIMESTAMP}}": hex_timestamp(timestamp),
+        "{{IPBUS_USERNAME}}": hex_string(username),
+        "{{IPBUS_HOSTNAME}}": hex_string(hostname),
+        "{{IPBUS_BUILD_VERSION}}": hex_value(build),
     }
 
     # Read content of source file.
-    with open(args.src) as src:
-        lines = src.readlines()
+    with open(src) as fp:
+        lines = fp.readlines()
 
     # Replace placeholders.
     for key, value in list(replace_map.items()):
@@ -111,8 +113,19 @@ def main():
                 lines[i] = line.replace(key, value)
 
     # Write content to destination file.
-    with open(args.dest, "wt") as dest:
-        dest.write("".join(lines))
+    with open(dest, "wt") as fp:
+        fp.write("".join(lines))
+
+
+def main():
+    args = parse_args()
+
+    if os.path.abspath(args.src) == os.path.abspath(args.dest):
+        print("for safety reasons it is not allowed to overwrite the source template.")
+        sys.exit(1)
+
+    # A zero timestamp (-t 0) means current time
+    patch(args.src, args.dest, args.build, args.timestamp or None, args.username, args.hostname)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 import argparse
+import contextlib
 import datetime
 import json
 import logging
@@ -9,16 +10,19 @@ import subprocess
 import sys
 import tempfile
 import time
-import urllib.request
-import urllib.parse
-import urllib.error
 
-from threading import Thread
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from threading import Lock
+from typing import Iterator
 
 from . import utils
 from .xmlmenu import XmlMenu
 
+try:
+    from orjson import loads as json_loads  # optional, faster parsing of large results files
+except ImportError:
+    json_loads = json.loads  # type: ignore
+
 IGNORED_ALGOS = [
     "L1_FirstBunchInTrain",
     "L1_SecondBunchInTrain"
@@ -27,8 +31,7 @@ IGNORED_ALGOS = [
 TIMEOUT_SEC: float = 60.0
 
 # terminal size
-with os.popen("stty size") as fp:
-    ts = int(fp.read().split()[1])
+ts = shutil.get_terminal_size(fallback=(120, 24)).columns
 
 failed_red = ("\033[1;31m Failed! \033[0m")
 mismatches_exit_red = ("\033[1;31m Mismatches occured !!! Exit on errors \033[0m")
@@ -78,6 +81,14 @@ TB_FILE = os.path.join("testbench", "gtl_fdl_wrapper_tb.vhd")
 INI_FILE = "modelsim.ini"
 DO_FILE_TPL = os.path.join("scripts", "templates", "gtl_fdl_wrapper_tpl_questa.do")
 
+VHDL_FILE_TPLS = [  # (template relative to uGT algos dir, output relative to module dir)
+    (os.path.join("hdl", "payload", "fdl", "algo_mapping_rop_tpl.vhd"), os.path.join("vhdl", "algo_mapping_rop.vhd")),
+    (os.path.join("hdl", "packages", "fdl_pkg_tpl.vhd"), os.path.join("vhdl", "fdl_pkg.vhd")),
+    (os.path.join("hdl", "payload", "gtl_module_tpl.vhd"), os.path.join("vhdl", "gtl_module.vhd")),
+]
+ADT_DEP_FILE = os.path.join("cfg", "anomaly_detection.dep")
+"""Anomaly detection dependency file relative to uGT algos dir."""
+
 max_algorithms: int = 512  # numbers of bits
 
 
@@ -86,109 +97,119 @@ def render_template(src, dst, args):
     >>> render_template("template.txt", "sample.txt", { 'foo' : "bar", })
     """
     logging.debug("rendering template %s as %s", src, dst)
-    with open(src) as f:
-        content = f.read()
-    for needle, subst in list(args.items()):
+    content = utils.read_file_cached(src)
+    for needle, subst in args.items():
         logging.debug("  replacing %r by %r", needle, subst)
-        content = content.replace(needle, subst)
+    content = utils.replace_all(content, args)
     with open(dst, "wt") as dst:
         dst.write(content)
 
 
-def write_testvector(mask, testvectorfile, new_testvector):
-    """uses mask of the module, testvector file and the path of the new
-    testvector file where the masked testvectors are stored"""
-    with open(testvectorfile, "rt") as tvf, open(new_testvector, "wt") as opf:
-        for line in tvf:
-            colums = line.strip().split()
-            mask_trigger = int(colums[-2], 16) & mask
-            colums[-2] = format(mask_trigger, "0128x")
-            colums[-1] = "1" if mask_trigger else "0"
-            opf.write(" ".join(colums))
-            opf.write("\n")
-
-
-def trigger_list(testvectorfile):
-    """makes a list of all triggers in testvectorfile eg. [1,0,0,1,0,1,0,0,1,1,1]"""
+def write_testvectors(testvectorfile, targets):
+    """reads testvector file line by line and writes masked testvectors of
+    all (mask, filename) pairs in *targets* in a single pass, returns the
+    trigger counts of all algorithms eg. [1,0,0,1,0,1,0,0,1,1,1]"""
     out_list = [0] * max_algorithms
-    with open(testvectorfile) as tvf:
+    no_trigger = f" {0:0128x} 0\n"
+    with contextlib.ExitStack() as stack:
+        tvf = stack.enter_context(open(testvectorfile, "rt"))
+        outputs = [(mask, stack.enter_context(open(filename, "wt"))) for mask, filename in targets]
         for line in tvf:
-            colums = line.strip().split()
-            trigger_list = bitfield(int(colums[-2], 16), max_algorithms)
-            out_list = [x + y for x, y in zip(out_list, trigger_list)]
+            colums = line.split()
+            prefix = " ".join(colums[:-2])
+            trigger = int(colums[-2], 16)
+            for bit in set_bits(trigger):  # only visit triggered algorithms
+                out_list[bit] += 1
+            for mask, opf in outputs:
+                mask_trigger = trigger & mask
+                if not mask_trigger:  # most events do not trigger any algorithm of the module
+                    opf.write(prefix + no_trigger)
+                    continue
+                opf.write(f"{prefix} {mask_trigger:0128x} 1\n")
     return out_list
 
 
-def bitfield(i: int, n: int) -> List[int]:
-    """converts intager to a list of 'n' bits
-    >>> bitfield(10, 4)
-    [0, 1, 0, 1]
+def load_json(filename):
+    """returns content of a JSON file"""
+    with open(filename, "rb") as fp:
+        return json_loads(fp.read())
+
+
+def set_bits(i: int) -> Iterator[int]:
+    """yields indices of bits set in integer in ascending order
+    >>> list(set_bits(10))
+    [1, 3]
     """
-    return [int(digit) for digit in "{0:0{1}b}".format(i, n)][::-1]
+    while i:
+        lsb = i & -i
+        yield lsb.bit_length() - 1
+        i ^= lsb
 
 
-def run_vsim(vsim, module, msgmode, ini_file):
-    """uses class module, arg msgmode and ini file path to start the simulation"""
+def run_vsim(vsim, module, msgmode, ini_file, startup_lock):
+    """uses class module, arg msgmode and ini file path to start the simulation,
+    the startup lock serializes simulation starts while the .do file is in use"""
     vsim_bin = os.path.join(vsim, "bin", "vsim")
-    with open(module.results_log, "wt") as logfile:
+    lock_file = os.path.join(module.path, "running.lock")
+    with open(module.results_log, "wb") as logfile:  # vsim writes to the file descriptor directly
         cmd = [vsim_bin, "-lic_noqueue", "-c", "-msgmode", msgmode, "-modelsimini", ini_file, "-do", "do {filename}; quit -f".format(filename=os.path.join(module.path, DO_FILE))]
-        logging.info("starting simulation for module_%d...", module.id)
-        logging.info("executing: %s", " ".join(['"{0}"'.format(arg) if " " in str(arg) else str(arg) for arg in cmd]))
-        subprocess.run(cmd, stdout=logfile).check_returncode()
+        with startup_lock:
+            logging.info("starting simulation for module_%d...", module.id)
+            logging.info("executing: %s", " ".join(['"{0}"'.format(arg) if " " in str(arg) else str(arg) for arg in cmd]))
+            process = subprocess.Popen(cmd, stdout=logfile)
+            try:
+                utils.wait_for_file(lock_file, TIMEOUT_SEC)  # stops starting of new simulations if .do file is still in use
+            except RuntimeError:
+                process.kill()
+                process.wait()
+                raise
+            os.remove(lock_file)
+        if process.wait():
+            raise subprocess.CalledProcessError(process.returncode, cmd)
         logging.info(f"simulation done.")
 
     # checks for the json file
-    t0 = time.monotonic()
-    while not os.path.exists(module.results_json):
-        dt = time.monotonic() - t0
-        if dt > TIMEOUT_SEC:
-            raise RuntimeError(f"Timeout waiting for creation of file: {module.results_json!r}")
-        time.sleep(0.100)
+    utils.wait_for_file(module.results_json, TIMEOUT_SEC)
+
+    algo_by_index = {algo.index: algo for algo in module.menu.algorithms}
 
     # writes to results.txt what bx number triggert which algorithm and how often
     with open(module.results_txt, "wt") as results_txt:
-        jsonf = json.load(open(module.results_json))
-        errors = jsonf["errors"]
+        module.results = load_json(module.results_json)
+        errors = module.results["errors"]
+        lines = []
         for error in errors:
-            results_txt.write("#" * 80 + "\n")
-            results_txt.write("bx-nr      = {}\n".format(error["bx-nr"]))
-            results_txt.write("algo_sim   = {}\n".format(error["algos_sim"]))
-            results_txt.write("algo_tv    = {}\n".format(error["algos_tv"]))
-            results_txt.write("fin_or_sim = {}\n".format(error["finor_sim"]))
-            results_txt.write("fin_or_tv  = {}\n".format(error["finor_tv"]))
-            results_txt.write("#" * 80 + "\n")
-
-            algos_sim_bin = bitfield(int(error["algos_sim"], 16), max_algorithms)
-            algos_tv_bin = bitfield(int(error["algos_tv"], 16), max_algorithms)
+            lines.extend([
+                "#" * 80 + "\n",
+                "bx-nr      = {}\n".format(error["bx-nr"]),
+                "algo_sim   = {}\n".format(error["algos_sim"]),
+                "algo_tv    = {}\n".format(error["algos_tv"]),
+                "fin_or_sim = {}\n".format(error["finor_sim"]),
+                "fin_or_tv  = {}\n".format(error["finor_tv"]),
+                "#" * 80 + "\n",
+            ])
+
+            algos_sim = int(error["algos_sim"], 16)
+            algos_tv = int(error["algos_tv"], 16)
             logging.debug("-" * ts)
 
-            for bit in range(max_algorithms):
-                if algos_tv_bin[bit] != algos_sim_bin[bit]:
-                    # checks if index has a algorithm name else wirtes not found
-                    if module.menu.algorithms.byIndex(bit):
-                        results_txt.write("\n")
-                        results_txt.write("algo {} ({})\n".format(bit, module.menu.algorithms.byIndex(bit).name))
-                        results_txt.write("     tv = {} sim = {}\n".format(algos_tv_bin[bit], algos_sim_bin[bit]))
-                        results_txt.write("\n")
-                    else:
-                        results_txt.write("\n")
-                        results_txt.write(f"algo with index: {bit} not found in menu\n")
-                        results_txt.write("\n")
+            for bit in set_bits(algos_tv ^ algos_sim):  # only visit mismatching algorithms
+                if bit >= max_algorithms:
+                    break
+                # checks if index has a algorithm name else wirtes not found
+                algo = algo_by_index.get(bit)
+                if algo:
+                    lines.append("\nalgo {} ({})\n     tv = {} sim = {}\n\n".format(bit, algo.name, (algos_tv >> bit) & 1, (algos_sim >> bit) & 1))
+                else:
+                    lines.append(f"\nalgo with index: {bit} not found in menu\n\n")
+        results_txt.writelines(lines)
 
         logging.info("finished simulating module_{}".format(module.id))
 
 
 def check_algocount(liste):
     """prosseses list so module id is in [0] and trgger count in [1] eg. [1, 255]"""
-    aus_liste = []
-    i = 0
-    for index in range(len(liste)):
-        if liste[index] != 0:
-            aus_liste.append((index, liste[index]))
-            i += 1
-    if i == 0:
-        aus_liste.append((-1, 0))
-    return aus_liste
+    return [(index, count) for index, count in enumerate(liste) if count] or [(-1, 0)]
 
 
 def check_multiple(liste):
@@ -216,14 +237,19 @@ class Module(object):
         self.results_json = os.path.join(self.path, f"results_module_{self.id:d}.json")
         self.results_log = os.path.join(self.path, f"results_module_{self.id:d}.log")
         self.results_txt = os.path.join(self.path, f"results_module_{self.id:d}.txt")
-
-    def get_mask(self):  # makes mask and saves it
-        mask = 0
-        for algo in self.menu.algorithms.byModuleId(self.id):
-            mask = mask | (1 << algo.index)
-        return mask
-
-    def make_files(self, sim_dir, view_wave, mp7_tag, menu_path, ipb_fw_dir):  # makes files for simulation
+        self.results = {}  # content of results_json, set by run_vsim
+        self._mask = None
+
+    @property
+    def mask(self):  # makes mask once and saves it
+        if self._mask is None:
+            mask = 0
+            for algo in self.menu.algorithms.byModuleId(self.id):
+                mask = mask | (1 << algo.index)
+            self._mask = mask
+        return self._mask
+
+    def make_files(self, sim_dir, view_wave, mp7_tag, menu_path, ipb_fw_dir, vhdl_templates, adt_vhd):  # makes files for simulation
         render_template(
             os.path.join(sim_dir, DO_FILE_TPL),
             os.path.join(self.path, DO_FILE_TMP),
@@ -244,7 +270,6 @@ class Module(object):
             }
         )
 
-        uGTalgosPath = os.path.abspath(os.path.join(sim_dir, ".."))
         src_dir = os.path.join(menu_path, "vhdl", f"module_{self.id:d}", "src")
 
         replace_map = {
@@ -255,30 +280,8 @@ class Module(object):
         }
 
         # Patch VHDL files
-        render_template(
-            os.path.join(uGTalgosPath, "hdl", "payload", "fdl", "algo_mapping_rop_tpl.vhd"),
-            os.path.join(self.path, "vhdl", "algo_mapping_rop.vhd"),
-            replace_map
-        )
-        render_template(
-            os.path.join(uGTalgosPath, "hdl", "packages", "fdl_pkg_tpl.vhd"),
-            os.path.join(self.path, "vhdl", "fdl_pkg.vhd"),
-            replace_map
-        )
-        render_template(
-            os.path.join(uGTalgosPath, "hdl", "payload", "gtl_module_tpl.vhd"),
-            os.path.join(self.path, "vhdl", "gtl_module.vhd"),
-            replace_map
-        )
-
-        # Create 'anomaly_detection.txt' from 'anomaly_detection.dep'
-        adt_dep_file = os.path.join(uGTalgosPath, "cfg", "anomaly_detection.dep")
-        adt_vhd = ""
-
-        if os.path.exists(adt_dep_file):
-            with open(adt_dep_file, "rt") as fp:
-                adt_vhd = fp.read()
-            adt_vhd = adt_vhd.replace("src ", "vcom -93 -work work $HDL_DIR/")
+        for template, filename in vhdl_templates:
+            render_template(template, os.path.join(self.path, filename), replace_map)
 
         # Insert content of 'anomaly_detection.txt' into DO_FILE
         render_template(
@@ -290,22 +293,30 @@ class Module(object):
         )
 
 
-def download_file_from_url(url, filename):
-    """Download files from URL."""
-    # Remove existing file.
-    utils.remove(filename)
-    # Download file
-    logging.info("retrieving %s", url)
-    urllib.request.urlretrieve(url, filename)
+def read_adt_vhd(adt_dep_file):
+    """Create 'anomaly_detection.txt' content from 'anomaly_detection.dep', same for all modules."""
+    try:
+        with open(adt_dep_file, "rt") as fp:
+            adt_vhd = fp.read()
+    except FileNotFoundError:
+        return ""
+    return adt_vhd.replace("src ", "vcom -93 -work work $HDL_DIR/")
+
+
+def git_clone(url, tag, dest, cwd):
+    """Shallow clone of a single branch or tag of a git repository."""
+    subprocess.run(["git", "clone", "--depth", "1", "--single-branch", url, "-b", tag, dest], cwd=cwd, check=True)
 
 
 def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a_url_menu, a_ipb_fw_url, a_ipb_fw_tag, a_questasimlibs, a_output, a_view_wave, a_wlf, a_verbose, a_tv, a_ignored):
 
     sim_dir = os.path.join(project_dir, "firmware", "sim")
 
-    # Copy modelsim.ini from questasimlib dir to sim dir (to get questasim libs corresponding to Vivado version)
+    # Copy modelsim.ini from questasimlib dir to sim dir (to get questasim libs corresponding to Vivado version).
+    # A private copy is required, vmap/vlib in the do files write to the ini file of the sim dir.
     source_filename = os.path.join(a_questasimlibs, "modelsim.ini")
     dest_filename = os.path.join(sim_dir, "modelsim.ini")
+    utils.remove_file(dest_filename)  # never write through a link left by a previous run
     shutil.copyfile(source_filename, dest_filename)
 
     # using SIM_ROOT dir as default output path
@@ -319,23 +330,14 @@ def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a
 
     logging.info("===========================================================================")
     logging.info("clone repos of MP7 and IPB-firmware to %r ...", sim_area)
-
-    # clone repos of MP7 and IPB-firmware to sim_area
-    subprocess.run(["git", "clone", a_mp7_url, "-b", a_mp7_tag, "mp7"], cwd=sim_area).check_returncode()
-    subprocess.run(["git", "clone", a_ipb_fw_url, "-b", a_ipb_fw_tag, "ipbus-firmware"], cwd=sim_area).check_returncode()
-
-    logging.info("===========================================================================")
     logging.info("download XML and testvector file from L1Menu repository ...")
+
     # Get l1menus_path for URL
     xml_name = "{}{}".format(a_menu, ".xml")
     menu_filepath = os.path.join(sim_area, xml_name)
     url = os.path.join(a_url_menu, "xml", xml_name)
 
     url_menu_split_0 = a_url_menu.split("/")[0]
-    if url_menu_split_0 == "https:":
-        download_file_from_url(url, menu_filepath) # retrieve xml file from repo
-    else:
-        shutil.copyfile(url, menu_filepath) # copy xml file from local path
 
     #if not os.path.exists(a_tv):
         #raise RuntimeError("\033[1;31m test vector file does not exist. \033[0m")
@@ -348,10 +350,23 @@ def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a
     #shutil.copyfile(a_tv, testvector_filepath)
 
     tv_split_0 = a_tv.split("/")[0]
-    if tv_split_0 == "https:":
-        download_file_from_url(a_tv, testvector_filepath) # retrieve xml file from repo
-    else:
-        shutil.copyfile(a_tv, testvector_filepath) # copy xml file from local path
+
+    # clone repos of MP7 and IPB-firmware to sim_area and fetch menu files concurrently
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [
+            executor.submit(git_clone, a_mp7_url, a_mp7_tag, "mp7", sim_area),
+            executor.submit(git_clone, a_ipb_fw_url, a_ipb_fw_tag, "ipbus-firmware", sim_area),
+        ]
+        if url_menu_split_0 == "https:":
+            futures.append(executor.submit(utils.download_file_from_url, url, menu_filepath))  # retrieve xml file from repo
+        else:
+            futures.append(executor.submit(shutil.copyfile, url, menu_filepath))  # copy xml file from local path
+        if tv_split_0 == "https:":
+            futures.append(executor.submit(utils.download_file_from_url, a_tv, testvector_filepath))  # retrieve testvector file from repo
+        else:
+            futures.append(executor.submit(shutil.copyfile, a_tv, testvector_filepath))  # copy testvector file from local path
+        for future in futures:
+            future.result()
 
     timestamp = time.time()  # creates timestamp
     _time = datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%dT%H-%M-%S")  # changes time apperance
@@ -364,6 +379,7 @@ def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a
         modules.append(Module(menu, module_id, base_dir))
 
     # Get VHDL snippets from menu URL
+    snippets = []
     for module in modules:
         vhdl_src_path = os.path.join("vhdl", f"module_{module.id:d}", "src")
         temp_dir_module = os.path.join(sim_area, vhdl_src_path)
@@ -373,10 +389,13 @@ def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a
                 vhdl_file_local_path = os.path.join(temp_dir_module, vhdl_name)
                 vhdl_file_path = os.path.join(vhdl_src_path, vhdl_name)
                 url = os.path.join(a_url_menu, vhdl_file_path)
-                if url_menu_split_0 == "https:":
-                    download_file_from_url(url, vhdl_file_local_path) # retrieve xml file from repo
-                else:
-                    shutil.copyfile(url, vhdl_file_local_path) # copy xml file from local path
+                snippets.append((url, vhdl_file_local_path))
+
+    if url_menu_split_0 == "https:":  # retrieve from repo or copy from local path
+        utils.download_files(snippets)
+    else:
+        for url, filename in snippets:
+            shutil.copyfile(url, filename)
 
     if not os.path.exists(menu_filepath):
         raise RuntimeError("Missing %s File" % menu_filepath)
@@ -391,23 +410,30 @@ def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a
 
     logging.info("creating Modules and Masks...")
 
+    # module independent paths
+    testvector_base_name = os.path.splitext(os.path.basename(testvector_filepath))[0]
+    mp7 = os.path.join(sim_area, "mp7")
+    ipb_fw = os.path.join(sim_area, "ipbus-firmware")
+    ugt_algos_dir = os.path.dirname(sim_dir)
+    vhdl_templates = [(os.path.join(ugt_algos_dir, template), filename) for template, filename in VHDL_FILE_TPLS]
+    adt_vhd = read_adt_vhd(os.path.join(ugt_algos_dir, ADT_DEP_FILE))
+
     for module in modules:  # gives each module the information
         module_id = f"module_{module.id:d}"
-        testvector_base_name = os.path.splitext(os.path.basename(testvector_filepath))[0]
         module.testvector_filepath = os.path.join(module.path, f"{testvector_base_name}_{module_id}.txt")
 
         os.makedirs(os.path.join(module.path, "testbench"))
         os.makedirs(os.path.join(module.path, "vhdl"))
-        logging.debug("Module_%d: %0128x", module.id, module.get_mask())
-
-        write_testvector(module.get_mask(), testvector_filepath, module.testvector_filepath)  # mask, testvectorfile, out_dir
+        logging.debug("Module_%d: %0128x", module.id, module.mask)
 
         logging.debug("Module_%d created at %s", module.id, base_dir)
 
-        mp7 = os.path.join(sim_area, "mp7")
-        ipb_fw = os.path.join(sim_area, "ipbus-firmware")
+        module.make_files(sim_dir, a_view_wave, mp7, sim_area, ipb_fw, vhdl_templates, adt_vhd)
 
-        module.make_files(sim_dir, a_view_wave, mp7, sim_area, ipb_fw)  # sim_dir, view_wave, mp7_tag, temp_dir
+    # Testvector is streamed once for all modules, writing masked testvectors
+    # and getting a list: index is algorithm index and content is the trigger
+    # count in the testvector file
+    trigger_liste = write_testvectors(testvector_filepath, [(module.mask, module.testvector_filepath) for module in modules])
 
     questasim_path = os.path.join(QuestaSimPath, "questasim")
 
@@ -415,22 +441,12 @@ def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a
     logging.info("===========================================================================")
     logging.info("starting simulations with Questa Simulator from directory %s", questasim_path)
 
-    threads = []
-    for module in modules:  # makes for all simulations a thread
-        thread = Thread(target=run_vsim, args=(questasim_path, module, msgmode, ini_file))
-        threads.append(thread)
-        thread.start()
-        lock_file = os.path.join(module.path, "running.lock")
-        t0 = time.monotonic()
-        while not os.path.exists(lock_file):  # stops starting of new threads if .do file is still in use
-            dt = time.monotonic() - t0
-            if dt > TIMEOUT_SEC:
-                raise RuntimeError(f"Timeout waiting for creation of file: {lock_file!r}")
-            time.sleep(0.100)
-        os.remove(lock_file)
-
-    for thread in threads:  # waits for all threads to finish
-        thread.join()
+    startup_lock = Lock()
+    max_workers = min(len(modules), os.cpu_count() or 4)  # do not oversubscribe the host with vsim processes
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_vsim, questasim_path, module, msgmode, ini_file, startup_lock) for module in modules]
+        for future in as_completed(futures):  # waits for all simulations to finish
+            future.result()
     logging.info("finished all simulations")
     print()
 
@@ -441,11 +457,9 @@ def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a
         error_jsonf[i] = {}
 
     for module in modules:  # steps through all modules and makes a list with trigger count and module
-        jsonf = json.load(open(module.results_json))
-        errors_jsonf = jsonf["errors"]
-        for err in errors_jsonf:
-            if err != "":
-                error_jsonf[module.id].update(jsonf)
+        jsonf = module.results  # already loaded by run_vsim
+        if any(err != "" for err in jsonf["errors"]):
+            error_jsonf[module.id] = jsonf
         counts = jsonf["counts"]
         for count in counts:
             index = count["algo_index"]
@@ -456,10 +470,10 @@ def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a
                 algos_tv[index] = []
             algos_tv[index].append(count["algo_tv"])
 
-    for index in range(len(algos_sim)):  # makes a list with tuples (module id, trigger count)
+    for index in sorted(algos_sim):  # makes a list with tuples (module id, trigger count)
         algos_sim[index] = check_algocount(algos_sim[index])
 
-    for index in range(len(algos_tv)):
+    for index in sorted(algos_tv):
         algos_tv[index] = check_algocount(algos_tv[index])
 
     # Summary logging
@@ -521,13 +535,14 @@ def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a
                 json_file = os.path.join(base_dir, "module_{}", "results_module_{}.json").format(i, i)
                 sum_log.info("\033[1;31m {} \033[0m ".format(json_file))
                 json_err_msg = False
-    trigger_liste = trigger_list(testvector_filepath)  # gets a list: index is algorithm index and content is the trigger count in the testvector file
+
+    algo_by_index = {algo.index: algo for algo in menu.algorithms}
 
     # prints bits which are present in the testvector but have no corresponding algo in the menu
     errors = []
 
     for index in range(len(trigger_liste)):
-        if menu.algorithms.byIndex(index) is None and trigger_liste[index] > 0:
+        if index not in algo_by_index and trigger_liste[index] > 0:
             errors.append((index, trigger_liste[index]))
 
     if errors:
@@ -541,21 +556,21 @@ def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a
             sum_log.info("|{:>7}|{:>8}|".format(index, triggers))  # prints all algorithms witch are not in the menu but also triggert for some reason
         sum_log.info("|-------|--------|")
 
-    for index in range(len(algos_sim)):  # checks if algorithm triggert more than once in simulation and testvector file and prints it red on screen
+    for index in sorted(algos_sim):  # checks if algorithm triggert more than once in simulation and testvector file and prints it red on screen
         if check_multiple(algos_sim[index]):
             sum_log.info("Multiple algorithms found in simulation!")
             for i in range(len(algos_sim[index])):
                 sum_log.info("Module: {}".format(algos_sim[index][0][0]))
                 sum_log.info("    Index: {}".format(index))
-                sum_log.info("    algoname: {}".format(menu.algorithms.byIndex(index).name if menu.algorithms.byIndex(index).name else "not found in menu"))
+                sum_log.info("    algoname: {}".format(algo_by_index[index].name if index in algo_by_index else "not found in menu"))
 
-    for index in range(len(algos_tv)):
+    for index in sorted(algos_tv):
         if check_multiple(algos_tv[index]):
             sum_log.info("Multiple algorithms found in testvectors!")
             for i in range(len(algos_tv[index])):
                 sum_log.info("Module: {}".format(algos_tv[index][0][0]))
                 sum_log.info("    Index: {}".format(index))
-                sum_log.info("    algoname: {}".format(menu.algorithms.byIndex(index).name if menu.algorithms.byIndex(index).name else "not found in menu"))
+                sum_log.info("    algoname: {}".format(algo_by_index[index].name if index in algo_by_index else "not found in menu"))
 
     print()
 
@@ -569,8 +584,7 @@ def run_simulation_questa(sim_area, project_dir, a_mp7_url, a_mp7_tag, a_menu, a
     # remove 'anomaly_detection.txt'
     cfg_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "firmware", "cfg")
     adt_txt = os.path.join(cfg_dir, "anomaly_detection.txt")
-    if os.path.exists(adt_txt):
-        utils.remove(adt_txt)
+    utils.remove_file(adt_txt)
 
     if not success:
         logging.info("===========================================================================")
@@ -624,8 +638,8 @@ def main():
     try:
       # Use non local project path
       if args.ugturl:
-          subprocess.run(["git", "clone", args.ugturl, "-b", args.ugttag], cwd=sim_area).check_returncode()
           project_name = os.path.splitext(os.path.basename(args.ugturl))[0]
+          git_clone(args.ugturl, args.ugttag, project_name, sim_area)
           args.project = os.path.join(sim_area, project_name)
 
       run_simulation_questa(
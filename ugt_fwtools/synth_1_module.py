@@ -7,7 +7,7 @@ import subprocess
 import shutil
 import sys
 from . import utils
-from .synthesis import create_module, implement_module, show_screen_sessions
+from .synthesis import VivadoBaseDir, create_module, implement_module, show_screen_sessions, validate_startup
 
 
 def parse_args():
@@ -26,39 +26,33 @@ def main() -> None:
 
     logger = utils.get_colored_logger(__name__)
 
-    if not os.path.isfile(args.filename):
-        logger.error(f"no such file: %r", args.filename)
-        raise RuntimeError("missing build config file")
-
-    # Check for UGT_VIVADO_BASE_DIR
-    args.vivado_base_dir = os.getenv("UGT_VIVADO_BASE_DIR")
-    if not args.vivado_base_dir:
-        logger.error("environment variable 'UGT_VIVADO_BASE_DIR' not set.")
-        logger.error("  Set with: 'export UGT_VIVADO_BASE_DIR=...'")
-        raise RuntimeError("missing variable: UGT_VIVADO_BASE_DIR")
+    # UGT_VIVADO_BASE_DIR already checked on import of synthesis module
+    args.vivado_base_dir = VivadoBaseDir
 
     config = configparser.ConfigParser()
-    config.read(args.filename)
+    if not config.read(args.filename):  # returns list of successfully read files
+        logger.error(f"no such file: %r", args.filename)
+        raise RuntimeError("missing build config file")
+    # Build config is written without interpolation, read it raw
+    cfg = {section: dict(config.items(section, raw=True)) for section in config.sections()}
 
-    args.board_type = config.get("device", "name")
-    args.build = config.get("menu", "build")
-    args.ipbb_dir = config.get("firmware", "buildarea")
-    args.project_type = config.get("firmware", "type")
-    args.vivado = config.get("vivado", "version")
+    args.board_type = cfg["device"]["name"]
+    args.build = cfg["menu"]["build"]
+    args.ipbb_dir = cfg["firmware"]["buildarea"]
+    args.project_type = cfg["firmware"]["type"]
+    args.vivado = cfg["vivado"]["version"]
 
     module_id = args.module_id
     module_name = f"module_{module_id}"
     module_path = os.path.join(args.ipbb_dir, "proj", module_name)
 
-    # Vivado settings
-    args.settings64 = os.path.join(args.vivado_base_dir, args.vivado, "settings64.sh")
-    if not os.path.isfile(args.settings64):
-        logger.error("no such Xilinx Vivado settings file: %r", args.settings64)
-        logger.error("  check if Xilinx Vivado %r is installed on this machine.", args.vivado)
-        raise RuntimeError("missing settings file")
+    # Validate everything before removing the existing module project
+    validate_startup(args, existing_build_area=True, logger=logger)
 
-    if os.path.exists(module_path):
+    try:
         shutil.rmtree(module_path)
+    except FileNotFoundError:
+        pass
 
     logger.info("===========================================================================")
     logger.info("creating IPBB project for module %s ...", module_id)
@@ -1,15 +1,17 @@
 import argparse
-import configparser
 import logging
 import os
 import pathlib
+import posixpath
 import shutil
 import subprocess
 import urllib.request
 import urllib.parse
 import urllib.error
-from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
 
+from . import pkgpatch
 from . import utils
 from .xmlmenu import XmlMenu
 
@@ -60,6 +62,49 @@ vhdl_snippets: List[str] = [
     "ugt_constants.vhd",
 ]
 
+vhdl_templates: List[Tuple[str, str]] = [
+    (os.path.join("hdl", "payload", "fdl", "algo_mapping_rop_tpl.vhd"), "algo_mapping_rop.vhd"),
+    (os.path.join("hdl", "packages", "fdl_pkg_tpl.vhd"), "fdl_pkg.vhd"),
+    (os.path.join("hdl", "payload", "gtl_module_tpl.vhd"), "gtl_module.vhd"),
+]
+"""VHDL templates relative to ugt firmware dir and their patched file names."""
+
+BuildConfigTemplate: str = """\
+[environment]
+timestamp = {args.timestamp}
+hostname = {args.hostname}
+username = {args.username}
+
+[menu]
+build = {build}
+name = {args.menu_name}
+location = {args.xml_uri}
+modules = {args.modules}
+
+[ipbb]
+version = {args.ipbb_version}
+
+[vivado]
+version = {args.vivado}
+
+[firmware]
+ipburl = {args.ipburl}
+ipbtag = {args.ipbtag}
+mp7url = {args.mp7url}
+mp7tag = {args.mp7tag}
+ugturl = {args.ugturl}
+ugttag = {args.ugttag}
+type = {args.project_type}
+buildarea = {args.ipbb_dir}
+
+[device]
+type = {args.board}
+name = {args.board_type}
+alias = {alias}
+
+"""
+"""Layout of build configuration file, same format as written by configparser."""
+
 
 def raw_build(build: str) -> str:
     """Return build id without hex prefix."""
@@ -71,23 +116,14 @@ def show_screen_sessions() -> None:
 
 
 def start_screen_session(session: str, commands: str) -> None:
-    subprocess.run(["screen", "-dmS", session, "bash", "-c", commands]).check_returncode()
+    subprocess.run(["screen", "-dmS", session, "bash", "-c", commands], check=True)
 
 
 def get_ipbb_version() -> str:
-    result = subprocess.run(["ipbb", "--version"], stdout=subprocess.PIPE)
+    result = subprocess.run(["ipbb", "--version"], stdout=subprocess.PIPE, check=True)
     return result.stdout.decode().split()[-1].strip()  # ipbb, version 0.5.2
 
 
-def download_file_from_url(url: str, filename: str) -> None:
-    """Download file from URL."""
-    # Remove existing file.
-    utils.remove(filename)
-    # Download file
-    logging.info("retrieving from: %r ", url)
-    urllib.request.urlretrieve(url, filename)
-
-
 def get_uri(path: str) -> str:
     """Return URI from path or URI."""
     if urllib.parse.urlparse(path).scheme:
@@ -97,6 +133,21 @@ def get_uri(path: str) -> str:
         return urllib.parse.urljoin("file:", urllib.request.pathname2url(str(uri_path)))
 
 
+def get_archive_uri(xml_uri: str) -> Optional[Tuple[str, str]]:
+    """Return GitLab archive URI of the menu's vhdl directory and the path of
+    that directory inside the repository, or None if *xml_uri* is not a
+    GitLab raw file URI.
+    >>> get_archive_uri("https://gitlab.cern.ch/foo/menu/-/raw/master/2024/L1Menu_X/xml/L1Menu_X.xml")
+    ('https://gitlab.cern.ch/foo/menu/-/archive/master/menu-master.tar.gz?path=2024%2FL1Menu_X%2Fvhdl', '2024/L1Menu_X/vhdl')
+    """
+    parts = utils.split_gitlab_raw_uri(xml_uri)
+    if parts is None:
+        return None
+    project_uri, ref, xml_path = parts
+    vhdl_path = posixpath.join(posixpath.dirname(posixpath.dirname(xml_path)), "vhdl")
+    return utils.gitlab_archive_uri(project_uri, ref, vhdl_path), vhdl_path
+
+
 def get_menu_name(path: str) -> str:
     return os.path.splitext(os.path.basename(path))[0]
 
@@ -112,27 +163,44 @@ def replace_vhdl_templates(vhdl_snippets_dir: str, src_fw_dir: str, dest_fw_dir:
         "{{gtl_module_instances}}": utils.read_file(os.path.join(vhdl_snippets_dir, "gtl_module_instances.vhd")),
     }
 
-    gtl_fdl_wrapper_dir = os.path.join(src_fw_dir, "hdl", "payload")
-    fdl_dir = os.path.join(gtl_fdl_wrapper_dir, "fdl")
-    pkg_dir = os.path.join(src_fw_dir, "hdl", "packages")
-
-    # Patch VHDL files in IPBB area (
-    utils.template_replace(os.path.join(fdl_dir, "algo_mapping_rop_tpl.vhd"), replace_map, os.path.join(dest_fw_dir, "algo_mapping_rop.vhd"))
-    utils.template_replace(os.path.join(pkg_dir, "fdl_pkg_tpl.vhd"), replace_map, os.path.join(dest_fw_dir, "fdl_pkg.vhd"))
-    utils.template_replace(os.path.join(gtl_fdl_wrapper_dir, "gtl_module_tpl.vhd"), replace_map, os.path.join(dest_fw_dir, "gtl_module.vhd"))
+    # Patch VHDL files in IPBB area
+    for template, filename in vhdl_templates:
+        utils.template_replace(os.path.join(src_fw_dir, template), replace_map, os.path.join(dest_fw_dir, filename))
 
 
 def create_build_area(args):
     """Creating IPBB build area."""
-    subprocess.run(["ipbb", "init", args.ipbb_dir]).check_returncode()
-    subprocess.run(["ipbb", "add", "git", args.ipburl, "-b", args.ipbtag], cwd=args.ipbb_dir).check_returncode()
-    subprocess.run(["ipbb", "add", "git", args.mp7url, "-b", args.mp7tag], cwd=args.ipbb_dir).check_returncode()
-    subprocess.run(["ipbb", "add", "git", args.ugturl, "-b", args.ugttag], cwd=args.ipbb_dir).check_returncode()
+    subprocess.run(["ipbb", "init", args.ipbb_dir], check=True)
+    # Clone repositories concurrently, each one into its own source directory,
+    # history is not required so only the tagged commit is fetched
+    repos = [
+        (args.ipburl, args.ipbtag),
+        (args.mp7url, args.mp7tag),
+        (args.ugturl, args.ugttag),
+    ]
+    if args.git_cache:
+        # Clone from local mirrors, only new objects are fetched from remote
+        with ThreadPoolExecutor(max_workers=len(repos)) as executor:
+            mirrors = list(executor.map(utils.ensure_git_mirror, [url for url, _ in repos]))
+        repos = [(f"file://{mirror}", tag) for mirror, (_, tag) in zip(mirrors, repos)]
+    processes = []
+    try:
+        for url, tag in repos:
+            cmd = ["ipbb", "add", "git", url, "-b", tag, "--depth", "1"]
+            processes.append((cmd, subprocess.Popen(cmd, cwd=args.ipbb_dir)))
+        for cmd, process in processes:
+            if process.wait():
+                raise subprocess.CalledProcessError(process.returncode, cmd)
+    finally:
+        for _, process in processes:
+            if process.poll() is None:
+                process.terminate()
+                process.wait()
 
 
 def create_module(module_id: int, module_name: str, args) -> None:
     """Create module IPBB project."""
-    subprocess.run(["ipbb", "proj", "create", "vivado", module_name, f"{args.board_type}:../{args.project_type}"], cwd=args.ipbb_dir).check_returncode()
+    subprocess.run(["ipbb", "proj", "create", "vivado", module_name, f"{args.board_type}:../{args.project_type}"], cwd=args.ipbb_dir, check=True)
 
 
 def implement_module(module_id: int, module_name: str, args) -> None:
@@ -149,49 +217,55 @@ def implement_module(module_id: int, module_name: str, args) -> None:
     start_screen_session(session, command)
 
 
+def prepare_module(module_id: int, src_fw_dir: str, dest_fw_dir: str, args) -> None:
+    """Replace VHDL templates, create and implement module IPBB project."""
+    module_name = f"module_{module_id}"
+
+    # Replace VHDL templates with downloaded VHDL snippets
+    logging.info("replace VHDL templates for module %s ...", module_id)
+    replace_vhdl_templates(os.path.join(dest_fw_dir, "vhdl_snippets"), src_fw_dir, dest_fw_dir)
+
+    logging.info("creating IPBB project for module %s ...", module_id)
+    create_module(module_id, module_name, args)
+
+    logging.info("running IPBB project, synthesis and implementation, creating bitfile for module %s ...", module_id)
+    implement_module(module_id, module_name, args)
+
+
 def write_build_config(filename: str, args) -> None:
     """Creating build configuration file."""
 
-    config = configparser.RawConfigParser()
-    config.add_section("environment")
-    config.set("environment", "timestamp", args.timestamp)
-    config.set("environment", "hostname", args.hostname)
-    config.set("environment", "username", args.username)
-
-    config.add_section("menu")
-    config.set("menu", "build", utils.build_t(args.build))
-    config.set("menu", "name", args.menu_name)
-    config.set("menu", "location", args.xml_uri)
-    config.set("menu", "modules", args.modules)
-
-    config.add_section("ipbb")
-    config.set("ipbb", "version", args.ipbb_version)
-
-    config.add_section("vivado")
-    config.set("vivado", "version", args.vivado)
-
-    config.add_section("firmware")
-    config.set("firmware", "ipburl", args.ipburl)
-    config.set("firmware", "ipbtag", args.ipbtag)
-    config.set("firmware", "mp7url", args.mp7url)
-    config.set("firmware", "mp7tag", args.mp7tag)
-    config.set("firmware", "ugturl", args.ugturl)
-    config.set("firmware", "ugttag", args.ugttag)
-    config.set("firmware", "type", args.project_type)
-    config.set("firmware", "buildarea", args.ipbb_dir)
-
-    config.add_section("device")
-    config.set("device", "type", args.board)
-    config.set("device", "name", args.board_type)
-    config.set("device", "alias", BoardAliases[args.board])
+    text = BuildConfigTemplate.format(args=args, build=utils.build_t(args.build), alias=BoardAliases[args.board])
 
     # Writing configuration file
     with open(filename, "wt") as fp:
-        config.write(fp)
+        fp.write(text)
 
     logging.info("created configuration file: %r", filename)
 
 
+def validate_startup(args, existing_build_area: bool = False, logger: Optional[logging.Logger] = None) -> None:
+    """Check Vivado settings and build area `args.ipbb_dir` before doing any
+    work, sets `args.settings64`. With *existing_build_area* the build area
+    must be a writable directory, else it must not exist yet.
+    """
+    log = logger or logging.getLogger()
+    args.settings64 = os.path.join(args.vivado_base_dir, args.vivado, "settings64.sh")
+    if not os.path.isfile(args.settings64):
+        log.error("no such Xilinx Vivado settings file: %r", args.settings64)
+        log.error("  check if Xilinx Vivado %r is installed on this machine.", args.vivado)
+        raise RuntimeError("missing settings file")
+    if existing_build_area:
+        if not os.path.isdir(args.ipbb_dir):
+            log.error("no such build area: %r", args.ipbb_dir)
+            raise RuntimeError("missing build area")
+        if not os.access(args.ipbb_dir, os.W_OK):
+            log.error("build area not writable: %r", args.ipbb_dir)
+            raise RuntimeError("build area not writable")
+    elif os.path.isdir(args.ipbb_dir):
+        raise RuntimeError(f"build area already exists: {args.ipbb_dir}")
+
+
 def parse_args():
     """Parse command line arguments."""
     parser = argparse.ArgumentParser()
@@ -206,6 +280,7 @@ def parse_args():
     parser.add_argument("--build", type=utils.build_str_t, required=True, metavar="<version>", help="menu build version (eg. 0x1001) [required]")
     parser.add_argument("--board", metavar="<type>", default=DefaultBoardType, choices=list(BoardAliases.keys()), help=f"set board type (default is {DefaultBoardType!r})")
     parser.add_argument("-p", "--path", metavar="<path>", default=DefaultFirmwareDir, type=os.path.abspath, help=f"fw build path (default is {DefaultFirmwareDir!r})")
+    parser.add_argument("--git-cache", action="store_true", help="clone repos from local mirrors kept in ~/.cache/ugt_fwtools/git")
     return parser.parse_args()
 
 
@@ -228,18 +303,8 @@ def main() -> None:
     # Setup console logging
     logging.basicConfig(format="%(levelname)s: %(message)s", level=logging.INFO)
 
-    # Check for UGT_VIVADO_BASE_DIR
-    args.vivado_base_dir = os.getenv("UGT_VIVADO_BASE_DIR")
-    if not args.vivado_base_dir:
-        raise RuntimeError("Environment variable 'UGT_VIVADO_BASE_DIR' not set. Set with: 'export UGT_VIVADO_BASE_DIR=...'")
-
-    # Vivado settings
-    args.settings64 = os.path.join(args.vivado_base_dir, args.vivado, "settings64.sh")
-    if not os.path.isfile(args.settings64):
-        raise RuntimeError(
-            f"no such Xilinx Vivado settings file {args.settings64!r}\n"
-            f"  check if Xilinx Vivado {args.vivado} is installed on this machine."
-        )
+    # UGT_VIVADO_BASE_DIR already checked on module import
+    args.vivado_base_dir = VivadoBaseDir
 
     # TODO
     # Board type taken from mp7url repo name
@@ -261,8 +326,7 @@ def main() -> None:
     vivado_version = f"vivado_{args.vivado}"
     args.ipbb_dir = os.path.join(args.path, args.build)
 
-    if os.path.isdir(args.ipbb_dir):
-        raise RuntimeError(f"build area already exists: {args.ipbb_dir}")
+    validate_startup(args)
 
     logging.info("===========================================================================")
     logging.info("creating IPBB area ...")
@@ -274,16 +338,12 @@ def main() -> None:
 
     xml_filename = os.path.join(args.ipbb_dir, "src", f"{args.menu_name}.xml")
 
-    logging.info("===========================================================================")
-    logging.info("retrieve %r...", xml_filename)
-    download_file_from_url(args.xml_uri, xml_filename)
-
     html_uri = urllib.parse.urljoin(args.xml_uri, f"../doc/{args.menu_name}.html")
     html_filename = os.path.join(args.ipbb_dir, "src", f"{args.menu_name}.html")
 
     logging.info("===========================================================================")
-    logging.info("retrieve %r...", html_filename)
-    download_file_from_url(html_uri, html_filename)
+    logging.info("retrieve %r and %r...", xml_filename, html_filename)
+    utils.download_files([(args.xml_uri, xml_filename), (html_uri, html_filename)])
 
     # Parse menu content
     menu = XmlMenu(xml_filename)
@@ -297,45 +357,40 @@ def main() -> None:
     if not args.modules:
         raise RuntimeError("Menu contains no modules")
 
-    ipbb_src_fw_dir = os.path.abspath(os.path.join(args.ipbb_dir, "src", args.project_type, "firmware"))
+    # Build area is an absolute path, see option --path
+    ipbb_src_dir = os.path.join(args.ipbb_dir, "src")
+    ipbb_src_fw_dir = os.path.join(ipbb_src_dir, args.project_type, "firmware")
+    ipbb_dest_fw_dirs = [os.path.join(ipbb_src_dir, f"module_{module_id}") for module_id in range(args.modules)]
 
+    # Download generated VHDL snippets of all modules from repository
+    logging.info("===========================================================================")
+    logging.info("retrieve VHDL snippets for %s modules ...", args.modules)
+    snippets = []  # paths relative to menu vhdl directory and local filenames
     for module_id in range(args.modules):
         module_name = f"module_{module_id}"
-        ipbb_module_dir = os.path.join(args.ipbb_dir, module_name)
-
-        ipbb_dest_fw_dir = os.path.abspath(os.path.join(args.ipbb_dir, "src", module_name))
-        os.makedirs(ipbb_dest_fw_dir)
-
-        # Download generated VHDL snippets from repository and replace VHDL templates
-        logging.info("===========================================================================")
-        logging.info(" *** module %s ***", module_id)
-        logging.info("===========================================================================")
-        logging.info("retrieve VHDL snippets for module %s and replace VHDL templates ...", module_id)
-        vhdl_snippets_dir = os.path.join(ipbb_dest_fw_dir, "vhdl_snippets")
+        vhdl_snippets_dir = os.path.join(ipbb_dest_fw_dirs[module_id], "vhdl_snippets")
         os.makedirs(vhdl_snippets_dir)
-
-        # TODO
         for vhdl_snippet in vhdl_snippets:
-            filename = os.path.join(vhdl_snippets_dir, vhdl_snippet)
-            snippet_uri = urllib.parse.urljoin(args.xml_uri, f"../vhdl/{module_name}/src/{vhdl_snippet}")
-            download_file_from_url(snippet_uri, filename)
-
-        replace_vhdl_templates(vhdl_snippets_dir, ipbb_src_fw_dir, ipbb_dest_fw_dir)
-
-        logging.info("patch the target package with current UNIX timestamp/username/hostname ...")
-        top_pkg_tpl = os.path.join(ipbb_src_fw_dir, "hdl", "packages", "gt_mp7_top_pkg_tpl.vhd")
-        top_pkg = os.path.join(ipbb_src_fw_dir, "hdl", "packages", "gt_mp7_top_pkg.vhd")
-        subprocess.run(["python", os.path.join(ipbb_src_fw_dir, "..", "scripts", "pkgpatch.py"), "--build", args.build, top_pkg_tpl, top_pkg]).check_returncode()
-
-        logging.info("===========================================================================")
-        logging.info("creating IPBB project for module %s ...", module_id)
-
-        create_module(module_id, module_name, args)
-
-        logging.info("===========================================================================")
-        logging.info("running IPBB project, synthesis and implementation, creating bitfile for module %s ...", module_id)
-
-        implement_module(module_id, module_name, args)
+            snippets.append((f"{module_name}/src/{vhdl_snippet}", os.path.join(vhdl_snippets_dir, vhdl_snippet)))
+    archive = get_archive_uri(args.xml_uri)
+    if not archive or not utils.extract_archive_files(archive[0], archive[1], snippets):
+        if archive:
+            logging.warning("falling back to single VHDL snippet downloads")
+        # Resolve menu vhdl directory once, snippet paths are plain relative paths
+        vhdl_uri = urllib.parse.urljoin(args.xml_uri, "../vhdl/")
+        utils.download_files([(f"{vhdl_uri}{path}", filename) for path, filename in snippets])
+
+    # Target package is shared by all modules, patch it once
+    logging.info("===========================================================================")
+    logging.info("patch the target package with current UNIX timestamp/username/hostname ...")
+    top_pkg_tpl = os.path.join(ipbb_src_fw_dir, "hdl", "packages", "gt_mp7_top_pkg_tpl.vhd")
+    top_pkg = os.path.join(ipbb_src_fw_dir, "hdl", "packages", "gt_mp7_top_pkg.vhd")
+    pkgpatch.patch(top_pkg_tpl, top_pkg, build=int(args.build, 16))
+
+    # Modules use distinct source and project directories, prepare them concurrently
+    with ThreadPoolExecutor(max_workers=min(args.modules, os.cpu_count() or 4)) as executor:
+        for future in [executor.submit(prepare_module, module_id, ipbb_src_fw_dir, dest_fw_dir, args) for module_id, dest_fw_dir in enumerate(ipbb_dest_fw_dirs)]:
+            future.result()
 
     # list running screen sessions
     logging.info("===========================================================================")
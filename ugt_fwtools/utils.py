@@ -1,14 +1,80 @@
 import datetime
-import glob
+import functools
+import hashlib
+import json
 import logging
 import shutil
 import stat
 import pwd
+import queue
 import socket
 import subprocess
 import os
+import posixpath
 import re
-from typing import Dict, Optional
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Dict, List, Optional, Pattern, Tuple
+
+try:
+    from inotify_simple import INotify, flags as inotify_flags  # type: ignore  # optional, Linux only
+except ImportError:
+    INotify = None  # type: ignore
+
+try:
+    import requests  # optional, reuses HTTP connections
+except ImportError:
+    requests = None  # type: ignore
+
+HTTP_TIMEOUT_SEC: float = 60.0
+
+HTTP_RETRIES: int = 3
+"""Retries of failed HTTP connections and server errors."""
+
+DOWNLOAD_WORKERS: int = 8
+"""Number of concurrent downloads, also size of the HTTP connection pool."""
+
+DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024
+"""Block size for writing streamed downloads."""
+
+DOWNLOAD_CACHE_MAX_FILE_SIZE: int = 16 * 1024 * 1024
+"""Larger HTTP downloads (e.g. testvectors) are not cached."""
+
+DOWNLOAD_CACHE_MAX_SIZE: int = 256 * 1024 * 1024
+"""Size limit of the HTTP download cache, least recently used files are removed."""
+
+VIVADO_EXIT_TIMEOUT_SEC: float = 60.0
+"""Time to wait for a Vivado session to exit before killing it."""
+
+
+def _create_http_session():
+    """Returns HTTP session with a connection pool shared by all download threads."""
+    session = requests.Session()
+    retries = requests.adapters.Retry(total=HTTP_RETRIES, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504), raise_on_status=False)
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=DOWNLOAD_WORKERS, max_retries=retries)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+_http_session = _create_http_session() if requests else None
+
+
+# Compiled patterns of argument validators
+_MENUNAME_RE = re.compile(r'^L1Menu_\w+\-{1}d[0-9]{1,2}$')
+_XMLNAME_RE = re.compile(r'^L1Menu_\w+')
+_VIVADO_RE = re.compile(r'^\d{4}\.\d{1}$')
+_IPBB_VERSION_RE = re.compile(r'^\d\.\d\.\d+$')
+_BUILD_STR_RE = re.compile(r'^0x[A-Fa-f0-9]{4}$')
+_YEAR_STR_RE = re.compile(r'^[0-9]{4}$')
+_QUESTASIM_RE = re.compile(r'^\d+\.\d{1}[a-z0-9_]{0,3}$')
 
 
 def build_t(value: str) -> str:
@@ -24,49 +90,49 @@ def build_t(value: str) -> str:
 
 def menuname_t(name: str) -> str:
     """XML name file name with distribution."""
-    if not re.match(r'^L1Menu_\w+\-{1}d[0-9]{1,2}$', name):
+    if not _MENUNAME_RE.match(name):
         raise ValueError("not a valid menu name: '{name}'".format(**locals()))
     return name
 
 
 def xmlname_t(name: str) -> str:
     """L1menu XML name tag."""
-    if not re.match(r'^L1Menu_\w+', name):
+    if not _XMLNAME_RE.match(name):
         raise ValueError("not a valid menu name: '{name}'".format(**locals()))
     return name
 
 
 def vivado_t(version: str) -> str:
     """Validates Xilinx Vivado version number."""
-    if not re.match(r'^\d{4}\.\d{1}$', version):
+    if not _VIVADO_RE.match(version):
         raise ValueError("not a xilinx vivado version: '{version}'".format(**locals()))
     return version
 
 
 def ipbb_version_t(version: str) -> str:
     """Validates IPBB version number."""
-    if not re.match(r'^\d\.\d\.\d+$', version):
+    if not _IPBB_VERSION_RE.match(version):
         raise ValueError("not a valid IPBB version: '{version}'".format(**locals()))
     return version
 
 
 def build_str_t(version: str) -> str:
     """Validates build number."""
-    if not re.match(r'^0x[A-Fa-f0-9]{4}$', version):
+    if not _BUILD_STR_RE.match(version):
         raise ValueError("not a valid build version: '{version}'".format(**locals()))
     return version
 
 
 def year_str_t(year: str) -> str:
     """Validates build number."""
-    if not re.match(r'^[0-9]{4}$', year):
+    if not _YEAR_STR_RE.match(year):
         raise ValueError("not a valid year: '{year}'".format(**locals()))
     return year
 
 
 def questasim_t(version: str) -> str:
     """Validates Questasim version."""
-    if not re.match(r'^\d+\.\d{1}[a-z0-9_]{0,3}$', version):
+    if not _QUESTASIM_RE.match(version):
         raise ValueError("not a valid Questasim version: '{version}'".format(**locals()))
     return version
 
@@ -81,6 +147,14 @@ def remove(filename: str) -> None:
         shutil.rmtree(filename)
 
 
+def remove_file(filename: str) -> None:
+    """Remove a file or symbolic link, ignoring if it does not exist."""
+    try:
+        os.unlink(filename)
+    except FileNotFoundError:
+        pass
+
+
 def read_file(filename: str) -> str:
     """Returns contents of a file.
     >>> read_file('spanish_inquisition.txt')
@@ -90,6 +164,47 @@ def read_file(filename: str) -> str:
         return fp.read()
 
 
+@functools.lru_cache(maxsize=64)
+def _read_file_cached(filename: str, mtime_ns: int, size: int) -> str:
+    return read_file(filename)
+
+
+def read_file_cached(filename: str) -> str:
+    """Returns contents of a file like read_file(), but reads a file only
+    once as long it is not modified. Use for templates read multiple times.
+    """
+    filename = os.path.abspath(filename)
+    st = os.stat(filename)
+    return _read_file_cached(filename, st.st_mtime_ns, st.st_size)
+
+
+@functools.lru_cache(maxsize=32)
+def _replace_pattern(keys: Tuple[str, ...]) -> Pattern:
+    # Longest keys first, in case a key is the prefix of another one
+    return re.compile("|".join(re.escape(key) for key in sorted(keys, key=len, reverse=True)))
+
+
+@functools.lru_cache(maxsize=32)
+def _template_pattern(keys: Tuple[str, ...]) -> Pattern:
+    # First group matches VHDL comment lines
+    return re.compile(r"(^[^\S\n]*--.*$)|" + _replace_pattern(keys).pattern, re.MULTILINE)
+
+
+def replace_all(content: str, replace_map: Dict[str, str]) -> str:
+    """Returns content with all keys of dictionary replaced by their values
+    in a single pass.
+    >>> replace_all("{{foo}} and {{bar}}", {"{{foo}}": "spam", "{{bar}}": "eggs"})
+    'spam and eggs'
+    """
+    if not replace_map:
+        return content
+    if len(replace_map) == 1:
+        key, value = next(iter(replace_map.items()))
+        return content.replace(key, value)
+    pattern = _replace_pattern(tuple(replace_map))
+    return pattern.sub(lambda match: replace_map[match.group(0)], content)
+
+
 def template_replace(template: str, replace_map: dict, result: str) -> None:
     """Load template by replacing keys from dictionary and writing to result
     file. The function ignores VHDL escaped lines.
@@ -98,24 +213,298 @@ def template_replace(template: str, replace_map: dict, result: str) -> None:
     >>> template_replace('sample.tpl.vhd', {'name': "title"}, 'sample.vhd')
 
     """
-    # Read content of source file.
-    with open(template, "rt") as fp:
-        lines = fp.readlines()
-    # Replace placeholders.
-    for key, value in list(replace_map.items()):
-        for i, line in enumerate(lines):
-            # Ignore VHDL comments
-            if not line.strip().startswith('--'):
-                lines[i] = line.replace(key, value)
+    # Read content of source file, templates are shared by all modules.
+    content = read_file_cached(template)
+    # Replace placeholders in a single pass, VHDL comment lines match as a whole and are kept.
+    if replace_map:
+        pattern = _template_pattern(tuple(replace_map))
+        content = pattern.sub(lambda match: match.group(0) if match.group(1) is not None else replace_map[match.group(0)], content)
     # Write content to destination file.
     with open(result, "wt") as fp:
-        fp.write(''.join(lines))
+        fp.write(content)
+
+
+def cache_dir(*paths: str) -> str:
+    """Returns path inside the user's ugt-fwtools cache directory, its parent
+    directory is created if it does not exist. Raises OSError if the cache
+    directory is not usable.
+    >>> cache_dir("downloads", "0123abcd")
+    '/home/user/.cache/ugt_fwtools/downloads/0123abcd'
+    """
+    base_dir = os.getenv("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    path = os.path.join(base_dir, "ugt_fwtools", *paths)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def cache_enabled(name: str) -> bool:
+    """Caches can be disabled by environment variable UGT_<NAME>_CACHE=0.
+    >>> cache_enabled("download")  # UGT_DOWNLOAD_CACHE
+    True
+    """
+    return os.getenv(f"UGT_{name.upper()}_CACHE", "1") != "0"
+
+
+def split_gitlab_raw_uri(uri: str) -> Optional[Tuple[str, str, str]]:
+    """Split GitLab raw file URI into project URI, ref and path of the file
+    inside the repository, returns None for other URIs. A ref containing
+    slashes must be URL encoded (%2F), else its remainder is taken as part
+    of the file path.
+    >>> split_gitlab_raw_uri("https://gitlab.cern.ch/foo/menu/-/raw/v1.0/xml/menu.xml")
+    ('https://gitlab.cern.ch/foo/menu', 'v1.0', 'xml/menu.xml')
+    """
+    parsed = urllib.parse.urlparse(uri)
+    project, sep, raw_path = parsed.path.partition("/-/raw/")
+    if not sep or parsed.scheme not in ("http", "https"):
+        return None
+    ref, _, path = raw_path.partition("/")
+    if not ref or not path:
+        return None
+    project_uri = urllib.parse.urlunparse(parsed._replace(path=project, params="", query="", fragment=""))
+    return project_uri, urllib.parse.unquote(ref), urllib.parse.unquote(path)
+
+
+def gitlab_archive_uri(project_uri: str, ref: str, path: str) -> str:
+    """Returns URI of a GitLab tar.gz archive of *path* at *ref*.
+    >>> gitlab_archive_uri("https://gitlab.cern.ch/foo/menu", "feature/x", "vhdl")
+    'https://gitlab.cern.ch/foo/menu/-/archive/feature/x/menu-feature-x.tar.gz?path=vhdl'
+    """
+    name = posixpath.basename(urllib.parse.urlparse(project_uri).path)
+    archive_name = f"{name}-{ref.replace('/', '-')}.tar.gz"
+    query = urllib.parse.urlencode({"path": path})
+    return f"{project_uri}/-/archive/{urllib.parse.quote(ref)}/{urllib.parse.quote(archive_name)}?{query}"
+
+
+def extract_archive_files(archive_uri: str, root_path: str, files: List[Tuple[str, str]]) -> bool:
+    """Download a tar archive and extract selected files. *files* is a list
+    of (path relative to *root_path* in the archive, filename) pairs. Returns
+    False if the archive is not available or any of the files is missing.
+    """
+    marker = f"/{root_path}/"
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            archive_filename = os.path.join(tmp_dir, "archive.tar.gz")
+            download_file_from_url(archive_uri, archive_filename)
+            with tarfile.open(archive_filename) as archive:
+                members = {}
+                for member in archive.getmembers():
+                    if member.isfile() and marker in f"/{member.name}":
+                        members[f"/{member.name}".split(marker, 1)[1]] = member
+                missing = [path for path, _ in files if path not in members]
+                if missing:
+                    logging.warning("missing %r in archive %s", missing[0], archive_uri)
+                    return False
+                for path, filename in files:
+                    with archive.extractfile(members[path]) as src, open(filename, "wb") as dest:  # type: ignore
+                        shutil.copyfileobj(src, dest)
+    except (OSError, EOFError, tarfile.TarError, zlib.error) as exc:
+        logging.warning("archive %s not available: %s", archive_uri, exc)
+        return False
+    return True
+
+
+def ensure_git_mirror(url: str) -> str:
+    """Returns path of a local bare mirror of git repository *url*, the
+    mirror is cloned on first use and updated on subsequent calls. The mirror
+    keeps the repository name, so clones of it get the same directory name.
+    """
+    name = posixpath.basename(url.rstrip("/"))
+    if not name.endswith(".git"):
+        name = f"{name}.git"
+    mirror = cache_dir("git", hashlib.sha1(url.encode()).hexdigest(), name)
+    if os.path.isdir(mirror):
+        logging.info("updating git mirror %s of %s", mirror, url)
+        subprocess.run(["git", "remote", "update", "--prune"], cwd=mirror, check=True)
+    else:
+        logging.info("creating git mirror %s of %s", mirror, url)
+        shutil.rmtree(f"{mirror}.tmp", ignore_errors=True)
+        subprocess.run(["git", "clone", "--mirror", url, f"{mirror}.tmp"], check=True)
+        os.replace(f"{mirror}.tmp", mirror)
+    return mirror
+
+
+def _download_cache_entry(url: str) -> Tuple[Optional[str], Dict[str, str]]:
+    """Returns cached body filename and stored response headers of *url*,
+    filename is None if the cache is disabled (UGT_DOWNLOAD_CACHE=0) or not
+    usable.
+    """
+    if not cache_enabled("download"):
+        return None, {}
+    try:
+        cached = cache_dir("downloads", hashlib.sha1(url.encode()).hexdigest())
+    except OSError as exc:
+        logging.warning("download cache not available: %s", exc)
+        return None, {}
+    try:
+        with open(f"{cached}.json", "rt") as fp:
+            headers = json.load(fp)
+        # Ignore entries with a body not belonging to its validators
+        if os.path.getsize(cached) != headers.pop("size", None):
+            headers = {}
+    except (OSError, ValueError, AttributeError):
+        headers = {}
+    return cached, headers
+
+
+def _write_atomic(filename: str, write) -> None:
+    """Write *filename* by calling *write* with a temporary file object and
+    replacing *filename* by it, readers never see partially written files.
+    """
+    fd, tmp_filename = tempfile.mkstemp(dir=os.path.dirname(filename), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as fp:
+            write(fp)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        remove_file(tmp_filename)
+        raise
+
+
+def _update_download_cache(cached: str, filename: str, url: str, headers: Dict[str, str]) -> None:
+    """Store downloaded *filename* and its validators as cache entry of *url*."""
+    try:
+        size = os.path.getsize(filename)
+        if size > DOWNLOAD_CACHE_MAX_FILE_SIZE:
+            return
+        with open(filename, "rb") as src:
+            _write_atomic(cached, lambda fp: shutil.copyfileobj(src, fp))
+        sidecar = json.dumps(dict(headers, url=url, size=size)).encode()
+        _write_atomic(f"{cached}.json", lambda fp: fp.write(sidecar))
+        _prune_download_cache(os.path.dirname(cached))
+    except OSError as exc:
+        logging.warning("unable to cache download of %s: %s", url, exc)
+
+
+def _prune_download_cache(cache_path: str) -> None:
+    """Remove least recently used cache entries exceeding DOWNLOAD_CACHE_MAX_SIZE."""
+    entries = []
+    try:
+        with os.scandir(cache_path) as it:
+            for entry in it:
+                if len(entry.name) == 40 and entry.is_file():  # SHA1 named bodies
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue  # removed by a concurrent process
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total_size <= DOWNLOAD_CACHE_MAX_SIZE:
+                break
+            remove_file(f"{path}.json")
+            remove_file(path)
+            total_size -= size
+    except OSError as exc:
+        logging.warning("unable to clean up download cache %s: %s", cache_path, exc)
+
+
+def _fetch_http(url: str, filename: str, cached: Optional[str], validators: Dict[str, str]) -> bool:
+    """Write content of HTTP *url* to *filename*, conditional on cached
+    *validators*. Returns False if a not modified body is no longer cached.
+    """
+    assert _http_session is not None
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    with _http_session.get(url, stream=True, timeout=HTTP_TIMEOUT_SEC, headers=headers) as response:
+        if response.status_code == 304 and headers and cached:
+            logging.debug("not modified, using cached %s", cached)
+            try:
+                shutil.copyfile(cached, filename)
+            except FileNotFoundError:
+                return False  # removed by a concurrent process
+            try:
+                os.utime(cached)  # mark as recently used
+            except OSError:
+                pass
+            return True
+        response.raise_for_status()
+        with open(filename, "wb") as fp:
+            for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                fp.write(chunk)
+        validators = {
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+    validators = {key: value for key, value in validators.items() if value}
+    if cached and validators:
+        _update_download_cache(cached, filename, url, validators)
+    return True
+
+
+def _fetch_url(url: str, filename: str) -> None:
+    """Write content of *url* to *filename*."""
+    if url.startswith("file:"):
+        # Local copy, uses os.sendfile() where available
+        shutil.copyfile(urllib.request.url2pathname(urllib.parse.urlparse(url).path), filename)
+        return
+    if _http_session is None or not url.startswith(("http://", "https://")):
+        urllib.request.urlretrieve(url, filename)
+        return
+    cached, validators = _download_cache_entry(url)
+    if not _fetch_http(url, filename, cached, validators):
+        _fetch_http(url, filename, cached, {})
+
+
+def download_file_from_url(url: str, filename: str) -> None:
+    """Download file from URL, the file is replaced only after a complete
+    download. With package `requests` installed, HTTP connections are reused
+    and unchanged files (by ETag or modification date) are not transferred
+    again.
+    """
+    logging.info("retrieving %s", url)
+    part_filename = f"{filename}.part"
+    try:
+        _fetch_url(url, part_filename)
+        os.replace(part_filename, filename)
+    except BaseException:
+        remove_file(part_filename)
+        raise
+
+
+def download_files(downloads: List[Tuple[str, str]]) -> None:
+    """Download list of (URL, filename) pairs concurrently."""
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as executor:
+        for future in [executor.submit(download_file_from_url, url, filename) for url, filename in downloads]:
+            future.result()
 
 
 def count_modules(menu: str) -> int:
     """Returns count of modules of menu. *menu* is the path to the menu directory."""
-    pattern = os.path.join(menu, 'vhdl', 'module_*')
-    return len(glob.glob(pattern))
+    try:
+        with os.scandir(os.path.join(menu, "vhdl")) as entries:
+            return sum(1 for entry in entries if entry.name.startswith("module_"))
+    except FileNotFoundError:
+        return 0
+
+
+def wait_for_file(filename: str, timeout: float) -> None:
+    """Wait until a file is created, raises a RuntimeError after *timeout*
+    seconds. Uses inotify if package `inotify_simple` is installed, else
+    falls back to polling.
+    """
+    t0 = time.monotonic()
+
+    def remaining() -> float:
+        dt = timeout - (time.monotonic() - t0)
+        if dt <= 0:
+            raise RuntimeError(f"Timeout waiting for creation of file: {filename!r}")
+        return dt
+
+    if INotify is not None:
+        try:
+            with INotify() as inotify:
+                # Watch before checking to not miss a file created in between
+                inotify.add_watch(os.path.dirname(os.path.abspath(filename)), inotify_flags.CREATE | inotify_flags.MOVED_TO)
+                while not os.path.exists(filename):
+                    inotify.read(timeout=int(remaining() * 1000) + 1)
+            return
+        except OSError:
+            pass  # eg. directory does not exist (yet), use polling
+    while not os.path.exists(filename):
+        time.sleep(min(0.100, remaining()))
 
 
 def timestamp() -> str:
@@ -134,42 +523,163 @@ def username():
     return pwd.getpwuid(os.getuid())[login]
 
 
-def vivado_batch(source: str) -> None:
-    subprocess.run(["vivado", "-mode", "batch", "-source", source, "-nojournal", "-nolog"]).check_returncode()
+def tcl_quote(value: str) -> str:
+    """Returns *value* as a single double quoted Tcl word, substitutions and
+    braces within the value are escaped.
+    >>> tcl_quote("/path/{with} $pecial [chars]")
+    '"/path/\\{with\\} \\$pecial \\[chars\\]"'
+    """
+    escaped = re.sub(r'([\\"$\[\]{}])', r"\\\1", value).replace("\n", "\\n")
+    return f'"{escaped}"'
 
 
-def colored(text: str, color: Optional[str] = None, on_color: Optional[str] = None, attrs: Optional[str] = None) -> str:
-    """Colorize text using ANSI escape sequences."""
-    COLORS = {
-        'grey': '30', 'red': '31', 'green': '32', 'yellow': '33',
-        'blue': '34', 'magenta': '35', 'cyan': '36', 'white': '37',
-    }
+class VivadoSession:
+    """Persistent Vivado Tcl shell, running multiple scripts within a single
+    Vivado process to pay its startup time only once.
 
-    BACKGROUND_COLORS = {
-        'on_grey': '40', 'on_red': '41', 'on_green': '42', 'on_yellow': '43',
-        'on_blue': '44', 'on_magenta': '45', 'on_cyan': '46', 'on_white': '47',
-    }
+    Example:
+    >>> with VivadoSession() as vivado:
+    ...     vivado.run("open_project sample.xpr\nclose_project")
+
+    """
+    marker = "__UGT_FWTOOLS_DONE__"  # never sent literally, as Vivado might echo its input
+
+    def __init__(self, command: Optional[List[str]] = None) -> None:
+        self.command: List[str] = command or ["vivado", "-mode", "tcl", "-nojournal", "-nolog"]
+        self.process: Optional[subprocess.Popen] = None
+        self._stdin: Optional[IO[str]] = None
+        self._lines: "queue.Queue[Optional[str]]" = queue.Queue()
+
+    def __enter__(self) -> "VivadoSession":
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def open(self) -> None:
+        """Start Vivado in Tcl mode."""
+        process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            universal_newlines=True,
+            bufsize=1,
+        )
+        assert process.stdin is not None and process.stdout is not None
+        self.process = process
+        self._stdin = process.stdin
+        # Read output in background to be able to time out and to detect a
+        # terminated process while waiting for a script to complete.
+        threading.Thread(target=self._read_lines, args=(process.stdout,), daemon=True).start()
+
+    def _read_lines(self, stdout: IO[str]) -> None:
+        for line in stdout:
+            self._lines.put(line)
+        self._lines.put(None)  # end of output
+
+    def run(self, script: str, timeout: Optional[float] = None) -> None:
+        """Run Tcl script and wait for its completion, raises a RuntimeError
+        if the script is incomplete, fails, Vivado terminates or the script
+        does not complete within *timeout* seconds.
+        """
+        if self.process is None or self._stdin is None:
+            raise RuntimeError("Vivado session not started")
+        head, tail = self.marker[:4], self.marker[4:]
+        # Script is sent as a single quoted word on a single line, so that
+        # Vivado never waits for more input, even for unbalanced braces.
+        self._stdin.write(
+            f"set ::ugt_fwtools_script {tcl_quote(script)}; "
+            f"if {{![info complete $::ugt_fwtools_script]}} {{set ::ugt_fwtools_rc 1; set ::ugt_fwtools_result {{incomplete script}}}} "
+            f"else {{set ::ugt_fwtools_rc [catch {{uplevel #0 $::ugt_fwtools_script}} ::ugt_fwtools_result]}}; "
+            f"if {{$::ugt_fwtools_rc}} {{puts [format \"%s{tail} ERROR %s\" {head} [string map [list \\n {{ }}] $::ugt_fwtools_result]]}} "
+            f"else {{puts [format \"%s{tail} OK\" {head}]}}; flush stdout\n"
+        )
+        self._stdin.flush()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = 1.0 if deadline is None else min(1.0, deadline - time.monotonic())
+            if wait <= 0:
+                self.process.kill()  # session is still busy, not reusable
+                raise RuntimeError(f"Vivado script timed out after {timeout} seconds")
+            try:
+                line = self._lines.get(timeout=wait)
+            except queue.Empty:
+                if self.process.poll() is not None and self._lines.empty():
+                    raise RuntimeError("Vivado session terminated unexpectedly")
+                continue
+            if line is None:
+                self._lines.put(None)  # keep end of output for close()
+                raise RuntimeError("Vivado session terminated unexpectedly")
+            if self.marker in line:
+                status, _, message = line.split(self.marker, 1)[1].strip().partition(" ")
+                if status != "OK":
+                    raise RuntimeError(f"Vivado script failed: {message}")
+                return
+            sys.stdout.write(line)
+
+    def close(self) -> None:
+        """Exit Vivado and wait for the process to terminate."""
+        if self.process is None or self._stdin is None:
+            return
+        process, stdin = self.process, self._stdin
+        self.process, self._stdin = None, None
+        try:
+            stdin.write("exit\n")
+            stdin.close()
+        except OSError:
+            pass  # already terminated
+        try:
+            process.wait(timeout=VIVADO_EXIT_TIMEOUT_SEC)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+        while True:
+            line = self._lines.get()
+            if line is None:
+                break
+            sys.stdout.write(line)
+
+
+_ANSI_COLORS: Dict[str, str] = {
+    'grey': '30', 'red': '31', 'green': '32', 'yellow': '33',
+    'blue': '34', 'magenta': '35', 'cyan': '36', 'white': '37',
+}
+
+_ANSI_BACKGROUND_COLORS: Dict[str, str] = {
+    'on_grey': '40', 'on_red': '41', 'on_green': '42', 'on_yellow': '43',
+    'on_blue': '44', 'on_magenta': '45', 'on_cyan': '46', 'on_white': '47',
+}
+
+_ANSI_ATTRIBUTES: Dict[str, str] = {
+    'bold': '1', 'dark': '2', 'underline': '4', 'blink': '5',
+    'reverse': '7', 'concealed': '8',
+}
+
+_ANSI_RESET: str = "\033[0m"
 
-    ATTRIBUTES = {
-        'bold': '1', 'dark': '2', 'underline': '4', 'blink': '5',
-        'reverse': '7', 'concealed': '8',
-    }
 
+def colored(text: str, color: Optional[str] = None, on_color: Optional[str] = None, attrs: Optional[str] = None) -> str:
+    """Colorize text using ANSI escape sequences."""
     if color is None and on_color is None and attrs is None:
         return text
 
     code_list = []
 
     if color:
-        code_list.append(COLORS[color])
+        code_list.append(_ANSI_COLORS[color])
     if on_color:
-        code_list.append(BACKGROUND_COLORS[on_color])
+        code_list.append(_ANSI_BACKGROUND_COLORS[on_color])
     if attrs:
         for attr in attrs:
-            code_list.append(ATTRIBUTES[attr])
+            code_list.append(_ANSI_ATTRIBUTES[attr])
 
     codes = ";".join(code_list)
-    return f"\033[{codes}m{text}\033[0m"
+    return f"\033[{codes}m{text}{_ANSI_RESET}"
+
+
+# Colored log handlers write to stderr, checked once on import
+_IS_TTY: bool = bool(sys.stderr and sys.stderr.isatty())
 
 
 class ColoredFormatter(logging.Formatter):
@@ -181,10 +691,16 @@ class ColoredFormatter(logging.Formatter):
         'ERROR': 'red',
         'CRITICAL': 'magenta'
     }
+    _PREFIXES = {level: f"\033[{_ANSI_COLORS[color]}m" for level, color in COLORS.items()}
 
     def format(self, record):
         log_message = super(ColoredFormatter, self).format(record)
-        return colored(log_message, color=self.COLORS.get(record.levelname))
+        if not _IS_TTY:  # no escape sequences in redirected output
+            return log_message
+        prefix = self._PREFIXES.get(record.levelname)
+        if prefix is None:
+            return log_message
+        return f"{prefix}{log_message}{_ANSI_RESET}"
 
 
 def get_colored_logger(name: str, level: int = logging.DEBUG) -> logging.Logger:
@@ -52,25 +52,6 @@ def get_xpath(elem, path, fmt=str):
         return fmt()  # retrun empty
 
 
-def fast_iter(context, func, *args, **kwargs):
-    """Fast XML iterator for huge XML files.
-    http://lxml.de/parsing.html#modifying-the-tree
-    Based on Liza Daly's fast_iter
-    http://www.ibm.com/developerworks/xml/library/x-hiperfparse/
-    See also http://effbot.org/zone/element-iterparse.htm
-    """
-    for event, elem in context:
-        func(elem, *args, **kwargs)
-        # It's safe to call clear() here because no descendants will be
-        # accessed
-        elem.clear()
-        # Also eliminate now-empty references from the root node to elem
-        for ancestor in elem.xpath('ancestor-or-self::*'):
-            while ancestor.getprevious() is not None:
-                del ancestor.getparent()[0]
-    del context
-
-
 class Algorithm(object):
     """Container holding a subset of algorithm information.
     Algorithm attributes:
@@ -161,24 +142,43 @@ class XmlMenu(object):
         return d
 
     def read(self, filename):
-        """Read XML from file and parse its content."""
+        """Read XML from file and parse its content in a single pass."""
         self.filename = os.path.abspath(filename)
         self.algorithms = AlgorithmContainer()
+        # Static elements (children of the root element) and their types
+        fields = {
+            'name': str,
+            'uuid_menu': str,
+            'uuid_firmware': str,
+            'grammar_version': str,
+            'is_valid': bool,
+            'is_obsolete': bool,
+            'n_modules': int,
+            'comment': str,
+        }
+        values = {}
         with open(self.filename, 'rb') as fp:
-            # Access static elements
-            context = etree.parse(fp)
-            self.name = get_xpath(context, 'name')
-            self.uuid_menu = get_xpath(context, 'uuid_menu')
-            self.uuid_firmware = get_xpath(context, 'uuid_firmware')
-            self.grammar_version = get_xpath(context, 'grammar_version')
-            self.is_valid = get_xpath(context, 'is_valid', bool)
-            self.is_obsolete = get_xpath(context, 'is_obsolete', bool)
-            self.n_modules = get_xpath(context, 'n_modules', int)
-            self.comment = get_xpath(context, 'comment')
-            # Access list of algorithms
-            fp.seek(0)  # Seek begin of file
-            context = etree.iterparse(fp, tag='algorithm')
-            fast_iter(context, self._read_algorithm)
+            context = etree.iterparse(fp, tag=('algorithm',) + tuple(fields))
+            for event, elem in context:
+                if elem.tag == 'algorithm':
+                    self._read_algorithm(elem)
+                else:
+                    parent = elem.getparent()
+                    if parent is None or parent.getparent() is not None:
+                        continue  # eg. algorithm name, read with its algorithm
+                    if elem.tag not in values:
+                        values[elem.tag] = get_xpath(elem, '.', fields[elem.tag])
+                # It's safe to clear algorithm and static elements as no
+                # descendants will be accessed later, also eliminate now-empty
+                # references from the root node to elem (Liza Daly's fast_iter,
+                # http://lxml.de/parsing.html#modifying-the-tree)
+                elem.clear()
+                for ancestor in elem.xpath('ancestor-or-self::*'):
+                    while ancestor.getprevious() is not None:
+                        del ancestor.getparent()[0]
+            del context
+        for key, fmt in fields.items():
+            setattr(self, key, values.get(key, fmt()))
 
     def _read_algorithm(self, elem):
         """Fetch information from an algorithm tag and appends it to the list of algorithms."""